@@ -25,7 +25,7 @@ from app.models import Base
 from app.models.user import User, Citizenship, Residence, Relationship
 from app.models.thread import Thread
 from app.models.dementia_daycare import DementiaDaycare
-from app.models.review import Review, ReviewSource, ReviewableType
+from app.models.review import Review, ReviewSource, ReviewableType, rebuild_review_aggregates
 from app.models.bookmark import Bookmark
 
 # Path to data directory
@@ -211,6 +211,8 @@ def seed_reviews(db: Session, daycares: list[DementiaDaycare]) -> list[Review]:
         reviews.append(review)
     
     db.add_all(reviews)
+    # Reviews are inserted directly, so recompute their rating summaries
+    rebuild_review_aggregates(db)
     db.commit()
     print(f"✓ Seeded {len(reviews)} reviews from {csv_path.name}")
     return reviews
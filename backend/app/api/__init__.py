@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException
 
-from app.api.routes import users, threads, reviews, services, subsidies, bookmarks
+from app.api.routes import users, threads, reviews, services, subsidies, bookmarks, metrics
 
 router = APIRouter()
 
@@ -10,6 +10,7 @@ router.include_router(reviews.router)
 router.include_router(services.router)
 router.include_router(subsidies.router)
 router.include_router(bookmarks.router)
+router.include_router(metrics.router)
 
 @router.get("/")
 async def root():
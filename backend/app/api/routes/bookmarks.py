@@ -1,13 +1,16 @@
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel, ConfigDict
 from pydantic.alias_generators import to_camel
 
 from app.models.review import ReviewableType
 from app.models.bookmark import Bookmark
-from app.core.database import DbDependency
+from sqlalchemy import select
+
+from app.core.database import AsyncDbDependency
 from app.core.auth import CurrentUserDependency
 from app.models import User
+from app.util.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, set_next_cursor
 
 router = APIRouter(prefix="/bookmarks", tags=["bookmarks"])
 
@@ -35,36 +38,42 @@ class BookmarkResponse(BookmarkBase):
 
 # Protected endpoint - requires authentication
 @router.get("", response_model=List[BookmarkResponse])
-def list_bookmarks(
-    db: DbDependency,
+async def list_bookmarks(
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency,
-    skip: Optional[int] = None,
-    limit: Optional[int] = None,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     target_type: Optional[ReviewableType] = None,
     target_id: Optional[int] = None,
 ):
     """
-    List bookmarks for the authenticated user.
+    List bookmarks for the authenticated user, oldest first.
+    The cursor of the next page is returned in the `X-Next-Cursor` header.
     """
-    query = db.query(Bookmark)
+    query = select(Bookmark)
     
     # Filter by authenticated user's ID
-    query = query.filter(Bookmark.user_id == current_user.clerk_id)
+    query = query.where(Bookmark.user_id == current_user.clerk_id)
     
     if target_type:
-        query = query.filter(Bookmark.target_type == target_type)
+        query = query.where(Bookmark.target_type == target_type)
     if target_id:
-        query = query.filter(Bookmark.target_id == target_id)
+        query = query.where(Bookmark.target_id == target_id)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, 1)
+        query = query.where(Bookmark.id > last_id)
 
-    bookmarks = query.offset(skip).limit(limit).all()
-    return bookmarks
+    # Fetch one extra bookmark to tell whether there is a next page
+    result = await db.execute(query.order_by(Bookmark.id).limit(limit + 1))
+    return set_next_cursor(response.headers, result.scalars().all(), limit, lambda bookmark: encode_cursor(bookmark.id))
 
 
 # Protected endpoint - requires authentication
 @router.post("", response_model=BookmarkResponse, status_code=201)
-def create_bookmark(
+async def create_bookmark(
     bookmark: BookmarkCreate, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     """
@@ -73,25 +82,25 @@ def create_bookmark(
     db_bookmark = Bookmark(**bookmark.model_dump(), user_id=current_user.clerk_id)
     db.add(db_bookmark)
     try:
-        db.commit()
-        db.refresh(db_bookmark)
+        await db.commit()
+        await db.refresh(db_bookmark)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     return db_bookmark
 
 
 # Protected endpoint - requires authentication
 @router.get("/{bookmark_id}", response_model=BookmarkResponse)
-def get_bookmark(
+async def get_bookmark(
     bookmark_id: int, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     """
     Get a specific bookmark by ID.
     """
-    bookmark = db.query(Bookmark).filter(Bookmark.id == bookmark_id).first()
+    bookmark = await db.get(Bookmark, bookmark_id)
     if not bookmark:
         raise HTTPException(status_code=404, detail="Bookmark not found")
     
@@ -104,15 +113,15 @@ def get_bookmark(
 
 # Protected endpoint - requires authentication
 @router.delete("/{bookmark_id}", status_code=204)
-def delete_bookmark(
+async def delete_bookmark(
     bookmark_id: int, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     """
     Delete a specific bookmark by ID.
     """
-    db_bookmark = db.query(Bookmark).filter(Bookmark.id == bookmark_id).first()
+    db_bookmark = await db.get(Bookmark, bookmark_id)
     if not db_bookmark:
         raise HTTPException(status_code=404, detail="Bookmark not found")
     
@@ -121,8 +130,8 @@ def delete_bookmark(
         raise HTTPException(status_code=403, detail="Cannot delete another user's bookmark")
     
     try:
-        db.delete(db_bookmark)
-        db.commit()
+        await db.delete(db_bookmark)
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
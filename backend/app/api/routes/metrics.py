@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Depends
+
+from app.core.auth import verify_admin_key
+from app.core.database import get_pool_stats
+
+router = APIRouter(prefix="/metrics", tags=["metrics"], dependencies=[Depends(verify_admin_key)])
+
+# Admin endpoint - requires the admin key. Database connection pool usage, for monitoring
+@router.get("/db-pool")
+async def db_pool_metrics():
+    return get_pool_stats()
@@ -1,16 +1,31 @@
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Depends
-from datetime import datetime
-from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from datetime import datetime, timezone
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from pydantic.alias_generators import to_camel
 
-from app.models.review import Review, ReviewSource, ReviewableType
-from app.core.database import DbDependency
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models.review import Review, ReviewAggregate, ReviewSource, ReviewableType, review_aggregate_update
+from app.core.database import AsyncDbDependency, ReadOnlyDbDependency
 from app.core.auth import CurrentUserDependency
 from app.models import User
+from app.util.response_cache import catalogue_cache
+from app.util.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, set_next_cursor
 
 router = APIRouter(prefix="/reviews", tags=["reviews"])
 
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Convert a datetime with a time zone to naive UTC, the form `published_time` is
+    stored in. asyncpg cannot bind datetimes with a time zone to that column.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 # Pydantic models for request/response
 class ReviewBase(BaseModel):
     model_config = ConfigDict(
@@ -31,6 +46,9 @@ class ReviewBase(BaseModel):
     google_author_photo_url: Optional[str] = None
     published_time: Optional[datetime] = None
 
+    # e.g. Google's `publishTime`, which is in UTC with a `Z` suffix
+    _published_time_to_naive_utc = field_validator("published_time")(to_naive_utc)
+
 class ReviewCreate(ReviewBase):
     pass
 
@@ -55,37 +73,186 @@ class ReviewResponse(ReviewBase):
     published_time: datetime
 
 
+class ReviewSummary(BaseModel):
+    review_count: int = 0
+    average_rating: float = 0
+    # Review counts for ratings 1 to 5
+    rating_histogram: List[int] = [0, 0, 0, 0, 0]
+
+    @classmethod
+    def from_aggregate(cls, aggregate: Optional[ReviewAggregate]) -> "ReviewSummary":
+        if aggregate is None:
+            return cls()
+        return cls(
+            review_count=aggregate.review_count,
+            average_rating=round(aggregate.average_rating, 1),
+            rating_histogram=aggregate.rating_histogram,
+        )
+
+
+# Shared helpers for embedding reviews in other resources' responses
+class ReviewPage(BaseModel):
+    model_config = ConfigDict(
+        alias_generator=to_camel,
+        populate_by_name=True
+    )
+
+    reviews: List[ReviewResponse]
+    # Pass as `cursor` to get the next page; None if this is the last page
+    next_cursor: Optional[str] = None
+
+
+# Reviews are paged newest first, using (published_time, id) as the keyset
+REVIEW_PAGE_SIZE = 10
+MAX_REVIEW_PAGE_SIZE = 50
+
+def _review_cursor(review: Review) -> str:
+    return encode_cursor(review.published_time, review.id)
+
+def _decode_review_cursor(cursor: str) -> Tuple[datetime, int]:
+    published_time, review_id = decode_cursor(cursor, 2)
+    if not isinstance(published_time, datetime):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return to_naive_utc(published_time), review_id
+
+async def load_review_page(
+    db: AsyncSession,
+    target_type: ReviewableType,
+    target_id: int,
+    cursor: Optional[str] = None,
+    limit: int = REVIEW_PAGE_SIZE
+) -> ReviewPage:
+    """
+    Load a page of a target's reviews, newest first, starting after the given cursor.
+    """
+    query = select(Review).where(
+        Review.target_type == target_type,
+        Review.target_id == target_id
+    )
+    if cursor:
+        published_time, review_id = _decode_review_cursor(cursor)
+        query = query.where(tuple_(Review.published_time, Review.id) < tuple_(published_time, review_id))
+
+    # Fetch one extra review to tell whether there is a next page
+    result = await db.execute(query.order_by(Review.published_time.desc(), Review.id.desc()).limit(limit + 1))
+    reviews = result.scalars().all()
+    return ReviewPage(
+        reviews=reviews[:limit],
+        next_cursor=_review_cursor(reviews[limit - 1]) if len(reviews) > limit else None
+    )
+
+async def load_first_review_pages(
+    db: AsyncSession,
+    target_type: ReviewableType,
+    target_ids: Iterable[int],
+    limit: int = REVIEW_PAGE_SIZE
+) -> Dict[int, ReviewPage]:
+    """
+    Load the first page of reviews of many targets of the same type in a single query.
+
+    Returns:
+        - Dict[int, ReviewPage]: First page for each of the given target ids (empty if no reviews)
+    """
+    reviews_by_target: Dict[int, List[Review]] = {target_id: [] for target_id in target_ids}
+    if not reviews_by_target:
+        return {}
+
+    ranked = select(
+        Review,
+        func.row_number().over(
+            partition_by=Review.target_id,
+            order_by=(Review.published_time.desc(), Review.id.desc())
+        ).label("rank")
+    ).where(
+        Review.target_type == target_type,
+        Review.target_id.in_(reviews_by_target.keys())
+    ).subquery()
+    ranked_review = aliased(Review, ranked)
+
+    # Fetch one extra review per target to tell whether there is a next page
+    result = await db.execute(select(ranked_review).where(
+        ranked.c.rank <= limit + 1
+    ).order_by(ranked.c.target_id, ranked.c.rank))
+    for review in result.scalars():
+        reviews_by_target[review.target_id].append(review)
+
+    return {
+        target_id: ReviewPage(
+            reviews=reviews[:limit],
+            next_cursor=_review_cursor(reviews[limit - 1]) if len(reviews) > limit else None
+        )
+        for target_id, reviews in reviews_by_target.items()
+    }
+
+async def load_review_summaries(
+    db: AsyncSession,
+    target_type: ReviewableType,
+    target_ids: Iterable[int]
+) -> Dict[int, ReviewSummary]:
+    """
+    Load the rating summaries of many targets of the same type from their aggregates.
+
+    Returns:
+        - Dict[int, ReviewSummary]: Summary for each of the given target ids (zeroed if no reviews)
+    """
+    target_ids = list(target_ids)
+    aggregates = {}
+    if target_ids:
+        result = await db.execute(select(ReviewAggregate).where(
+            ReviewAggregate.target_type == target_type,
+            ReviewAggregate.target_id.in_(target_ids)
+        ))
+        aggregates = {aggregate.target_id: aggregate for aggregate in result.scalars()}
+
+    return {
+        target_id: ReviewSummary.from_aggregate(aggregates.get(target_id))
+        for target_id in target_ids
+    }
+
+
+async def invalidate_target_caches(*target_types: ReviewableType):
+    """Drop cached responses that embed review summaries of the given target types."""
+    if ReviewableType.DEMENTIA_DAY_CARE in target_types:
+        await catalogue_cache.invalidate()
+
+
 # Public endpoint - anyone can read reviews
 @router.get("", response_model=List[ReviewResponse])
-def list_reviews(
-    db: DbDependency,
-    skip: Optional[int] = None,
-    limit: Optional[int] = None,
+async def list_reviews(
+    db: ReadOnlyDbDependency,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     target_type: Optional[ReviewableType] = None,
     target_id: Optional[int] = None,
     review_source: Optional[ReviewSource] = None,
 ):
     """
-    List reviews with optional filtering and pagination. Public endpoint.
+    List reviews with optional filtering, newest first. Public endpoint.
+    The cursor of the next page is returned in the `X-Next-Cursor` header.
     """
-    query = db.query(Review)
+    query = select(Review)
     
     if target_type:
-        query = query.filter(Review.target_type == target_type)
+        query = query.where(Review.target_type == target_type)
     if target_id:
-        query = query.filter(Review.target_id == target_id)
+        query = query.where(Review.target_id == target_id)
     if review_source:
-        query = query.filter(Review.review_source == review_source)
-    
-    reviews = query.offset(skip).limit(limit).all()
-    return reviews
+        query = query.where(Review.review_source == review_source)
+    if cursor:
+        published_time, review_id = _decode_review_cursor(cursor)
+        query = query.where(tuple_(Review.published_time, Review.id) < tuple_(published_time, review_id))
+
+    # Fetch one extra review to tell whether there is a next page
+    result = await db.execute(query.order_by(Review.published_time.desc(), Review.id.desc()).limit(limit + 1))
+    return set_next_cursor(response.headers, result.scalars().all(), limit, _review_cursor)
 
 
 # Protected endpoint - requires authentication to create reviews
 @router.post("", response_model=ReviewResponse, status_code=201)
-def create_review(
+async def create_review(
     review: ReviewCreate, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     """
@@ -98,21 +265,23 @@ def create_review(
     db_review = Review(**review_data)
     db.add(db_review)
     try:
-        db.commit()
-        db.refresh(db_review)
+        await db.execute(review_aggregate_update(db_review.target_type, db_review.target_id, db_review.overall_rating, 1))
+        await db.commit()
+        await db.refresh(db_review)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
+    await invalidate_target_caches(db_review.target_type)
     return db_review
 
 
 # Public endpoint - anyone can read a single review
 @router.get("/{review_id}", response_model=ReviewResponse)
-def get_review(review_id: int, db: DbDependency):
+async def get_review(review_id: int, db: ReadOnlyDbDependency):
     """
     Get a specific review by ID. Public endpoint.
     """
-    review = db.query(Review).filter(Review.id == review_id).first()
+    review = await db.get(Review, review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
     return review
@@ -120,46 +289,57 @@ def get_review(review_id: int, db: DbDependency):
 
 # Public endpoint - for upserting Google reviews (used by scrapers)
 @router.put("/google-reviews/{review_id}", response_model=ReviewResponse)
-async def upsert_review(review_id: str, review: GoogleReviewCreate, db: DbDependency):
+async def upsert_review(review_id: str, review: GoogleReviewCreate, db: AsyncDbDependency):
     """
     Update a specific google review by ID or create it if it does not exist.
     This endpoint is public as it's used by data scrapers.
     """
-    existing_review = db.query(Review).filter(
+    result = await db.execute(select(Review).where(
         Review.google_review_id == review_id
-    ).first()
-
-    if existing_review:
-        # Update the existing review
-        for field, value in review.model_dump(exclude_unset=True).items():
-            setattr(existing_review, field, value)
-        db_review = existing_review
-    else:
-        # Create a new review
-        db_review = Review(**review.model_dump())
-        db.add(db_review)
+    ))
+    existing_review = result.scalars().first()
 
     try:
-        db.commit()
-        db.refresh(db_review)
+        if existing_review:
+            # Update the existing review, moving it between aggregates if its rating or target changed
+            previous = (existing_review.target_type, existing_review.target_id, existing_review.overall_rating)
+            for field, value in review.model_dump(exclude_unset=True).items():
+                setattr(existing_review, field, value)
+            db_review = existing_review
+            previous_target_type = previous[0]
+
+            current = (db_review.target_type, db_review.target_id, db_review.overall_rating)
+            if current != previous:
+                await db.execute(review_aggregate_update(*previous, -1))
+                await db.execute(review_aggregate_update(*current, 1))
+        else:
+            # Create a new review
+            db_review = Review(**review.model_dump())
+            db.add(db_review)
+            previous_target_type = db_review.target_type
+            await db.execute(review_aggregate_update(db_review.target_type, db_review.target_id, db_review.overall_rating, 1))
+
+        await db.commit()
+        await db.refresh(db_review)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
+    await invalidate_target_caches(previous_target_type, db_review.target_type)
     return db_review
 
 
 # Protected endpoint - requires authentication to delete reviews
 @router.delete("/{review_id}", status_code=204)
-def delete_review(
+async def delete_review(
     review_id: int, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     """
     Delete a specific review by ID. Requires authentication.
     """
-    db_review = db.query(Review).filter(Review.id == review_id).first()
+    db_review = await db.get(Review, review_id)
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
     
@@ -168,8 +348,10 @@ def delete_review(
         raise HTTPException(status_code=403, detail="Cannot delete another user's review")
     
     try:
-        db.delete(db_review)
-        db.commit()
+        await db.delete(db_review)
+        await db.execute(review_aggregate_update(db_review.target_type, db_review.target_id, db_review.overall_rating, -1))
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
+    await invalidate_target_caches(db_review.target_type)
@@ -1,22 +1,55 @@
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Response, status, Depends
-from pydantic import BaseModel, ConfigDict
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status, Depends
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 from pydantic.alias_generators import to_camel
-from sqlalchemy import and_
+from sqlalchemy import and_, delete, select
 from sqlalchemy.exc import IntegrityError
-from heapq import nsmallest
-from haversine import haversine
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import DbDependency
+from app.core.database import AsyncDbDependency, ReadOnlyDbDependency
 from app.core.auth import CurrentUserDependency
+from app.core.cache import Cache
 from app.models import User
 from app.models.dementia_daycare import DementiaDaycare
-from app.models.review import Review, ReviewableType
-from app.api.routes.reviews import ReviewBase
-from app.util.maps import getCoordFromAddress, getRouteDistance
+from app.models.review import Review, ReviewAggregate, ReviewableType
+from app.api.routes.reviews import (
+    MAX_REVIEW_PAGE_SIZE,
+    REVIEW_PAGE_SIZE,
+    ReviewBase,
+    ReviewPage,
+    load_first_review_pages,
+    load_review_page,
+    load_review_summaries,
+)
+from app.models.travel_time import PostalCodeTravelTime
+from app.util.maps import DISTANCE_MATRIX_MAX_DESTINATIONS, POSTAL_CODE_PATTERN, RouteDistance, getCoordFromAddress, getRouteDistancesByMode
+from app.util.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, set_next_cursor
+from app.util.response_cache import catalogue_cache
+from app.util.spatial import SpatialIndex
 
 router = APIRouter(prefix="/dementia-daycare", tags=["dementia-daycare"])
 
+# Nearest-neighbour index over centre locations, built on first use. Writes to
+# centres bump its version in the shared cache, so every worker rebuilds its copy
+daycare_index = SpatialIndex()
+daycare_index_cache = Cache("daycare-index")
+
+async def load_daycare_index(db: AsyncSession) -> SpatialIndex:
+    version = await daycare_index_cache.get("version")
+    if not daycare_index.is_loaded or daycare_index.version != version:
+        result = await db.execute(select(
+            DementiaDaycare.id, DementiaDaycare.lat, DementiaDaycare.lng
+        ).where(
+            DementiaDaycare.lat.isnot(None),
+            DementiaDaycare.lng.isnot(None)
+        ))
+        daycare_index.load(result.all(), version)
+    return daycare_index
+
+async def invalidate_daycare_index():
+    await daycare_index_cache.incr("version")
+    daycare_index.invalidate()
+
 # Pydantic models for request/response validation
 # TODO: add price info from scraper
 class DementiaDaycareBase(BaseModel):
@@ -73,18 +106,45 @@ class DementiaDaycarePreference(BaseModel):
 class DementiaDaycareBaseResponse(DementiaDaycareBase):
     id: int
 
+    review_count: int = 0
+    average_rating: float = 0
+
 class DementiaDaycareDetailResponse(DementiaDaycareDetails):
     id: int
 
     review_count: int
     average_rating: float
+    rating_histogram: List[int]
+    # First page of reviews, newest first. Later pages are fetched with `next_reviews_cursor`
+    # from `GET /services/dementia-daycare/{center_id}/reviews`
     reviews: List[ReviewBase]
+    next_reviews_cursor: Optional[str] = None
 
 class DementiaDaycareRecommendation(DementiaDaycareDetailResponse):
     distance_from_home: Optional[float] = None
     driving_duration: Optional[int] = None
     transit_duration: Optional[int] = None
 
+async def build_detail_responses(
+    db: AsyncSession,
+    centers: List[DementiaDaycare],
+    response_cls: type = DementiaDaycareDetailResponse
+) -> List[DementiaDaycareDetailResponse]:
+    # Fetch review summaries and first review pages for all centers at once
+    center_ids = [center.id for center in centers]
+    summaries = await load_review_summaries(db, ReviewableType.DEMENTIA_DAY_CARE, center_ids)
+    review_pages = await load_first_review_pages(db, ReviewableType.DEMENTIA_DAY_CARE, center_ids)
+
+    return [
+        response_cls(
+            **center.__dict__,
+            **summaries[center.id].model_dump(),
+            reviews=review_pages[center.id].reviews,
+            next_reviews_cursor=review_pages[center.id].next_cursor
+        )
+        for center in centers
+    ]
+
 class DementiaDaycareAddress(BaseModel):
     model_config = ConfigDict(
         alias_generator=to_camel,
@@ -96,48 +156,95 @@ class DementiaDaycareAddress(BaseModel):
     name: str
     address: str
 
+async def list_daycare_centers(
+    db: AsyncSession,
+    headers: dict,
+    cursor: Optional[str],
+    limit: int,
+    min_rating: Optional[float]
+) -> List[DementiaDaycareBaseResponse]:
+    query = select(
+        DementiaDaycare, ReviewAggregate
+    ).outerjoin(
+        ReviewAggregate,
+        and_(
+            ReviewAggregate.target_type == ReviewableType.DEMENTIA_DAY_CARE,
+            ReviewAggregate.target_id == DementiaDaycare.id
+        )
+    )
+
+    if min_rating is not None:
+        query = query.where(ReviewAggregate.average_rating >= min_rating)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, 1)
+        query = query.where(DementiaDaycare.id > last_id)
+
+    # Fetch one extra row to tell whether there is a next page
+    result = await db.execute(query.order_by(DementiaDaycare.id).limit(limit + 1))
+    rows = set_next_cursor(headers, result.all(), limit, lambda row: encode_cursor(row[0].id))
+    return [
+        DementiaDaycareBaseResponse(
+            **center.__dict__,
+            review_count=aggregate.review_count if aggregate else 0,
+            average_rating=round(aggregate.average_rating, 1) if aggregate else 0
+        )
+        for center, aggregate in rows
+    ]
+
+# Serializers for responses stored in the catalogue cache
+center_list_adapter = TypeAdapter(List[DementiaDaycareBaseResponse])
+address_list_adapter = TypeAdapter(List[DementiaDaycareAddress])
+
 # Routes
 # List all dementia daycare centers
 @router.get("", response_model=List[DementiaDaycareBaseResponse])
 async def get_all_daycare_centers(
-    db: DbDependency,
-    skip: Optional[int] = None,
-    limit: Optional[int] = None
+    request: Request,
+    db: AsyncDbDependency,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    min_rating: Optional[float] = None
 ):
-    centers = db.query(
-        DementiaDaycare
-    ).offset(skip).limit(limit).all()
+    """
+    List centres in id order, a page at a time. The cursor of the next page is
+    returned in the `X-Next-Cursor` header.
+    """
+    async def build():
+        headers = {}
+        centers = await list_daycare_centers(db, headers, cursor, limit, min_rating)
+        return center_list_adapter.dump_json(centers, by_alias=True), headers
 
-    return centers
+    return await catalogue_cache.respond(request, build)
 
 # List all dementia daycare centre addresses for the scraper
 @router.get("/addresses", response_model=List[DementiaDaycareAddress])
-async def get_all_daycare_addresses(db: DbDependency):
-    centers = db.query(DementiaDaycare).all()
-    addresses = []
-    for center in centers:
-        address_parts = [center.block, center.street_name, center.building_name, center.unit_no, center.postal_code]
-        addresses.append(DementiaDaycareAddress(
-            id=center.id,
-            name=center.name,
-            address=" ".join([part for part in address_parts if part])
-        ))
-    return addresses
+async def get_all_daycare_addresses(request: Request, db: AsyncDbDependency):
+    async def build():
+        centers = (await db.execute(select(DementiaDaycare))).scalars().all()
+        addresses = []
+        for center in centers:
+            address_parts = [center.block, center.street_name, center.building_name, center.unit_no, center.postal_code]
+            addresses.append(DementiaDaycareAddress(
+                id=center.id,
+                name=center.name,
+                address=" ".join([part for part in address_parts if part])
+            ))
+        return address_list_adapter.dump_json(addresses, by_alias=True), None
+
+    return await catalogue_cache.respond(request, build)
 
 # Rank all dementia daycare centers based on user preferences
 @router.post("/recommendations", response_model=List[DementiaDaycareRecommendation])
 async def rank_daycare_centers(
     pref: DementiaDaycarePreference,
-    db: DbDependency,
-    limit: int = 3,
+    db: AsyncDbDependency,
+    # Bounded so that each travel mode needs a single Distance Matrix request
+    limit: int = Query(default=3, ge=1, le=DISTANCE_MATRIX_MAX_DESTINATIONS),
 ):
-    # Fetch centers
-    centers = db.query(DementiaDaycare).all()
-
     # Get lat and lng of provided address
     home_coords = None
     if pref.location:
-        home_coords = getCoordFromAddress(pref.location)
+        home_coords = await getCoordFromAddress(pref.location, db)
         if not home_coords:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -145,90 +252,117 @@ async def rank_daycare_centers(
             )
 
     # Get top k closest centers
-    centers = nsmallest(
-        limit, 
-        centers, 
-        key=lambda c: haversine((home_coords[0], home_coords[1]), (c.lat, c.lng))
-    ) if pref.location else centers[:limit]
-
-    response: List[DementiaDaycareRecommendation] = []
-    for center in centers:
-        reviews = db.query(Review).filter(
-            and_(
-                Review.target_type == ReviewableType.DEMENTIA_DAY_CARE,
-                Review.target_id == center.id
+    if home_coords:
+        index = await load_daycare_index(db)
+        nearest_ids = [id for id, _ in index.nearest(home_coords[0], home_coords[1], limit)]
+        result = await db.execute(select(DementiaDaycare).where(DementiaDaycare.id.in_(nearest_ids)))
+        centers_by_id = {center.id: center for center in result.scalars()}
+        centers = [centers_by_id[id] for id in nearest_ids if id in centers_by_id]
+    else:
+        centers = (await db.execute(select(DementiaDaycare).limit(limit))).scalars().all()
+
+    # Get driving and transit routes to all centers, from the precomputed
+    # table if the address has a postal code, else from Google Maps
+    routes = None
+    if home_coords:
+        routes = {"driving": [None] * len(centers), "transit": [None] * len(centers)}
+
+        postal_code_match = POSTAL_CODE_PATTERN.search(pref.location)
+        if postal_code_match:
+            result = await db.execute(select(PostalCodeTravelTime).where(
+                PostalCodeTravelTime.postal_code == postal_code_match.group(1),
+                PostalCodeTravelTime.center_id.in_([center.id for center in centers])
+            ))
+            travel_times = {travel_time.center_id: travel_time for travel_time in result.scalars()}
+            for i, center in enumerate(centers):
+                travel_time = travel_times.get(center.id)
+                if travel_time:
+                    routes["driving"][i] = RouteDistance(
+                        distance=travel_time.driving_distance,
+                        duration=travel_time.driving_duration
+                    )
+                    # Transit distance is not stored as it is not part of the response
+                    routes["transit"][i] = RouteDistance(distance=0, duration=travel_time.transit_duration)
+
+        missing = [i for i, route in enumerate(routes["driving"]) if route is None]
+        if missing:
+            live_routes = await getRouteDistancesByMode(
+                home_coords,
+                [(centers[i].lat, centers[i].lng) for i in missing]
             )
-        ).all()
-
-        center_response = DementiaDaycareRecommendation(
-            **center.__dict__,
-            review_count=len(reviews),
-            average_rating=round(sum([review.overall_rating for review in reviews]) / len(reviews), 1) if reviews else 0,
-            reviews=[ReviewBase.model_validate(review) for review in reviews]
-        )
-
-        if home_coords:
-            driving_dist = getRouteDistance(home_coords, (center.lat, center.lng), "driving")
-            transit_dist = getRouteDistance(home_coords, (center.lat, center.lng), "transit")
-            center_response.distance_from_home = driving_dist.distance
-            center_response.driving_duration = driving_dist.duration
-            center_response.transit_duration = transit_dist.duration
-        
-        response.append(center_response)
-
-    # Sort centers again by distance from home (with more accurate values from gmaps)
+            for mode, mode_routes in live_routes.items():
+                for i, route in zip(missing, mode_routes):
+                    routes[mode][i] = route
+
+    response: List[DementiaDaycareRecommendation] = await build_detail_responses(db, centers, DementiaDaycareRecommendation)
+    for i, center_response in enumerate(response):
+
+        if routes:
+            # Unroutable centres are left without a distance or duration for that mode
+            driving_dist = routes["driving"][i]
+            transit_dist = routes["transit"][i]
+            if driving_dist:
+                center_response.distance_from_home = driving_dist.distance
+                center_response.driving_duration = driving_dist.duration
+            if transit_dist:
+                center_response.transit_duration = transit_dist.duration
+
+
+    # Sort centers again by distance from home (with more accurate values from gmaps),
+    # with centres that cannot be driven to last
     if pref.location:
-        response.sort(key=lambda x: x.distance_from_home)
+        response.sort(key=lambda x: (x.distance_from_home is None, x.distance_from_home or 0))
     
     return response
 
 # Get specific dementia daycare center by ID
 @router.get("/{center_id}", response_model=DementiaDaycareDetailResponse)
 async def get_daycare_center(
+    request: Request,
     center_id: int,
-    db: DbDependency
+    db: AsyncDbDependency
 ):
-    center = db.query(
-        DementiaDaycare
-    ).filter(
-        DementiaDaycare.id == center_id
-    ).first()
-    
-    if not center:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Dementia daycare center not found"
-        )
+    async def build():
+        center = await db.get(DementiaDaycare, center_id)
 
-    reviews = db.query(Review).filter(
-        and_(
-            Review.target_type == ReviewableType.DEMENTIA_DAY_CARE,
-            Review.target_id == center_id
-        )
-    ).all()
+        if not center:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Dementia daycare center not found"
+            )
 
-    return DementiaDaycareDetailResponse(
-        **center.__dict__,
-        review_count=len(reviews),
-        average_rating=round(sum([review.overall_rating for review in reviews]) / len(reviews), 1) if reviews else 0,
-        reviews=[ReviewBase.model_validate(review) for review in reviews]
-    )
+        response = (await build_detail_responses(db, [center]))[0]
+        return response.model_dump_json(by_alias=True).encode(), None
+
+    return await catalogue_cache.respond(request, build)
+
+# Get reviews of a specific dementia daycare center, newest first
+@router.get("/{center_id}/reviews", response_model=ReviewPage)
+async def get_daycare_center_reviews(
+    center_id: int,
+    db: ReadOnlyDbDependency,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=REVIEW_PAGE_SIZE, ge=1, le=MAX_REVIEW_PAGE_SIZE)
+):
+    return await load_review_page(db, ReviewableType.DEMENTIA_DAY_CARE, center_id, cursor, limit)
 
 # Create new dementia daycare center (admin only)
 @router.post("", status_code=status.HTTP_201_CREATED)
-def create_daycare_center(
+async def create_daycare_center(
     center: DementiaDaycareCreate,
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     try:
         db_center = DementiaDaycare(**center.model_dump())
         db.add(db_center)
-        db.commit()
-        db.refresh(db_center)
+        await db.commit()
+        await db.refresh(db_center)
+        await invalidate_daycare_index()
+        await catalogue_cache.invalidate()
         return db_center
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A center with this friendly_id already exists"
@@ -239,7 +373,7 @@ def create_daycare_center(
 async def update_daycare_center(
     center_id: int,
     update_data: DementiaDaycarePatch,
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency,
     override: bool = False
 ):
@@ -249,9 +383,7 @@ async def update_daycare_center(
     By default, `override` is False, and the update will only apply to empty fields.
     """
     # Get existing center
-    center = db.query(DementiaDaycare).filter(
-        DementiaDaycare.id == center_id
-    ).first()
+    center = await db.get(DementiaDaycare, center_id)
     
     if not center:
         raise HTTPException(
@@ -273,32 +405,21 @@ async def update_daycare_center(
             if should_update:
                 setattr(center, field, new_value)
 
-        db.commit()
-        db.refresh(center)
+        await db.commit()
+        await db.refresh(center)
+        await invalidate_daycare_index()
+        await catalogue_cache.invalidate()
 
-        # Fetch reviews for the response
-        reviews = db.query(Review).filter(
-            and_(
-                Review.target_type == ReviewableType.DEMENTIA_DAY_CARE,
-                Review.target_id == center.id
-            )
-        ).all()
-
-        return DementiaDaycareDetailResponse(
-            **center.__dict__,
-            review_count=len(reviews),
-            average_rating=round(sum([review.overall_rating for review in reviews]) / len(reviews), 1) if reviews else 0,
-            reviews=[ReviewBase.model_validate(review) for review in reviews]
-        )
+        return (await build_detail_responses(db, [center]))[0]
 
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Database integrity error occurred"
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -308,13 +429,14 @@ async def update_daycare_center(
 @router.put("", response_model=DementiaDaycareDetailResponse)
 async def upsert_daycare_center(
     center: DementiaDaycareCreate,
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     # Check if center exists with the given friendly_id
-    existing_center = db.query(DementiaDaycare).filter(
+    result = await db.execute(select(DementiaDaycare).where(
         DementiaDaycare.friendly_id == center.friendly_id
-    ).first()
+    ))
+    existing_center = result.scalars().first()
 
     try:
         if existing_center:
@@ -327,23 +449,12 @@ async def upsert_daycare_center(
             db_center = DementiaDaycare(**center.model_dump())
             db.add(db_center)
         
-        db.commit()
-        db.refresh(db_center)
-
-        # Fetch reviews for the response
-        reviews = db.query(Review).filter(
-            and_(
-                Review.target_type == ReviewableType.DEMENTIA_DAY_CARE,
-                Review.target_id == db_center.id
-            )
-        ).all()
+        await db.commit()
+        await db.refresh(db_center)
+        await invalidate_daycare_index()
+        await catalogue_cache.invalidate()
 
-        response = DementiaDaycareDetailResponse(
-            **db_center.__dict__,
-            review_count=len(reviews),
-            average_rating=round(sum([review.overall_rating for review in reviews]) / len(reviews), 1) if reviews else 0,
-            reviews=[ReviewBase.model_validate(review) for review in reviews]
-        )
+        response = (await build_detail_responses(db, [db_center]))[0]
 
         return Response(
             status_code=status.HTTP_201_CREATED if not existing_center else status.HTTP_200_OK,
@@ -352,13 +463,13 @@ async def upsert_daycare_center(
         )
 
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Database integrity error occurred"
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -366,26 +477,35 @@ async def upsert_daycare_center(
 
 # DELETE dementia daycare center (admin only)
 @router.delete("/{center_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_daycare_center(
+async def delete_daycare_center(
     center_id: int,
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
-    center = db.query(DementiaDaycare).filter(DementiaDaycare.id == center_id).first()
+    center = await db.get(DementiaDaycare, center_id)
     if not center:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Dementia daycare center not found"
         )
     
-    db.delete(center)
-    db.commit()
+    await db.delete(center)
 
-    # Delete all reviews associated with this center
-    db.query(Review).filter(
+    # Delete all reviews associated with this center, along with their aggregate
+    await db.execute(delete(Review).where(
         and_(
             Review.target_type == ReviewableType.DEMENTIA_DAY_CARE,
             Review.target_id == center_id
         )
-    ).delete()
+    ))
+    await db.execute(delete(ReviewAggregate).where(
+        and_(
+            ReviewAggregate.target_type == ReviewableType.DEMENTIA_DAY_CARE,
+            ReviewAggregate.target_id == center_id
+        )
+    ))
+
+    await db.commit()
+    await invalidate_daycare_index()
+    await catalogue_cache.invalidate()
     return None
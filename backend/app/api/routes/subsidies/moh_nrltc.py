@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, ConfigDict
 
 from app.api.routes.users import PCHIBase
-from app.core.database import DbDependency
+from app.core.database import AsyncDbDependency
 from app.core.auth import CurrentUserDependency
 from app.models import User, Citizenship
 
@@ -18,8 +18,8 @@ class PCHIResponse(PCHIBase):
 
 # Protected endpoint - requires authentication to calculate PCHI
 @router.post("", response_model=PCHIResponse)
-def calculate_pchi(
-    db: DbDependency,
+async def calculate_pchi(
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     # current_user is already the authenticated user
@@ -1,22 +1,27 @@
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Depends
+from starlette.background import BackgroundTask
 from sse_starlette.sse import EventSourceResponse
-from openai import OpenAI
 from openai import NotFoundError
 from pydantic import BaseModel, ConfigDict
 
-from app.util.openai import remove_citation, stream_chat_responses
-from app.core.database import DbDependency
-from app.core.auth import CurrentUserDependency
+from app.util.openai import client, load_thread_messages, replay_answer, stream_chat_responses
+from app.util.answer_cache import clear_answer_cache, get_cached_answer
+from app.util.run_scheduler import RunQueueFull, run_scheduler
+from sqlalchemy import select
+
+from app.core.database import AsyncDbDependency
+from app.core.auth import CurrentUserDependency, verify_admin_key
 from app.models import User, Thread
 
 router = APIRouter()
-client = OpenAI()
 
 
 # Pydantic models
 class ChatCompletionRequest(BaseModel):
     query: str
+    # Always run the assistant, instead of replaying a cached answer to the same question
+    no_cache: bool = False
 
 class ThreadCreateRequest(BaseModel):
     pass
@@ -40,20 +45,22 @@ class ThreadReadResponse(ThreadBase):
 @router.post('/threads')
 async def create_thread(
     current_user: CurrentUserDependency,
-    db: DbDependency = None
+    db: AsyncDbDependency = None
 ) -> ThreadCreateResponse:
     # current_user is already verified to exist in database from the dependency
     
     # Create thread in OpenAI
-    new_thread = client.beta.threads.create()
+    new_thread = await client.beta.threads.create()
 
     # Store in database
     thread = Thread(
         thread_id=new_thread.id, 
         user_id=current_user.clerk_id,
+        # A new thread has no messages, so its (empty) local store is complete
+        messages_synced=True,
     )
     db.add(thread)
-    db.commit()
+    await db.commit()
 
     return ThreadCreateResponse(thread_id=new_thread.id)
 
@@ -63,11 +70,12 @@ async def create_thread(
 async def thread_messages(
     thread_id: str, 
     current_user: CurrentUserDependency,
-    db: DbDependency = None
+    db: AsyncDbDependency = None
 ):
     try:
         # First check if thread exists and user has access
-        thread = db.query(Thread).filter(Thread.thread_id == thread_id).first()
+        result = await db.execute(select(Thread).where(Thread.thread_id == thread_id))
+        thread = result.scalars().first()
         if not thread:
             raise HTTPException(status_code=404, detail="Thread not found")
 
@@ -75,19 +83,15 @@ async def thread_messages(
         if thread.user_id != current_user.clerk_id:
             raise HTTPException(status_code=403, detail="Access denied")
 
-        # Get messages from OpenAI
-        thread_messages = client.beta.threads.messages.list(thread_id)
-        extracted_values = []
-        for message in thread_messages:
-            for content_block in message.content:
-                extracted_values.append({
-                    "id": message.id,
-                    "role": message.role,
-                    "content": remove_citation(content_block.text.value)
-                })
-
-        extracted_values.reverse()
-        return extracted_values
+        # Read messages from the local store, syncing new ones from OpenAI if needed
+        return [
+            {
+                "id": message.message_id,
+                "role": message.role,
+                "content": message.content
+            }
+            for message in await load_thread_messages(db, thread)
+        ]
     except Exception as e:
         if isinstance(e, NotFoundError):
             raise HTTPException(status_code=404, detail="Thread is not found")
@@ -100,10 +104,11 @@ async def create_message(
     thread_id: str, 
     req: ChatCompletionRequest, 
     current_user: CurrentUserDependency,
-    db: DbDependency = None
+    db: AsyncDbDependency = None
 ) -> EventSourceResponse:
     # Verify thread access
-    thread = db.query(Thread).filter(Thread.thread_id == thread_id).first()
+    result = await db.execute(select(Thread).where(Thread.thread_id == thread_id))
+    thread = result.scalars().first()
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
 
@@ -111,19 +116,57 @@ async def create_message(
     if thread.user_id != current_user.clerk_id:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    # Add the query as the title of the thread, if it's not already set
-    if not thread.title:
-        thread.title = req.query
-        db.add(thread)
-        db.commit()
+    # Only the first message of a thread is answered from the answer cache, since
+    # later answers depend on the conversation
+    use_answer_cache = not thread.title and not req.no_cache
+    answer = await get_cached_answer(req.query) if use_answer_cache else None
+
+    # Request a run slot before the stream starts, so that a full queue is refused
+    # with a 503 rather than failing mid-stream. Cached answers need no slot.
+    ticket = None
+    if answer is None:
+        try:
+            ticket = run_scheduler.enqueue(current_user.clerk_id)
+        except RunQueueFull:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many chats in progress, please try again shortly",
+                headers={"Retry-After": "5"}
+            )
+
+    try:
+        # Add the query as the title of the thread, if it's not already set
+        if not thread.title:
+            thread.title = req.query
+            db.add(thread)
+            await db.commit()
+    except Exception:
+        if ticket is not None:
+            ticket.release()
+        raise
+
+    if answer is not None:
+        return EventSourceResponse(replay_answer(thread_id, req.query, answer))
+
+    # The stream releases the ticket when it ends; the background task also covers
+    # a stream that never starts, e.g. if the client disconnects first
+    return EventSourceResponse(
+        stream_chat_responses(thread_id, req.query, ticket, cache_reply=use_answer_cache),
+        background=BackgroundTask(ticket.release)
+    )
+
 
-    return EventSourceResponse(stream_chat_responses(thread_id, req.query))
+# Admin endpoint - requires the admin key. Call after the assistant's knowledge base changes.
+@router.delete('/threads/answer-cache', status_code=204, dependencies=[Depends(verify_admin_key)])
+async def clear_cached_answers():
+    await clear_answer_cache()
 
 
 # Protected endpoint - requires authentication
 @router.get('/threads', response_model=List[ThreadReadResponse])
 async def read_user_threads(
     current_user: CurrentUserDependency,
-    db: DbDependency = None
+    db: AsyncDbDependency = None
 ):
-    return db.query(Thread).filter(Thread.user_id == current_user.clerk_id).all()
+    result = await db.execute(select(Thread).where(Thread.user_id == current_user.clerk_id))
+    return result.scalars().all()
@@ -4,9 +4,11 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, ConfigDict
 from pydantic.alias_generators import to_camel
 
+from sqlalchemy import select
+
 from app.api.routes.threads import ThreadReadResponse
-from app.core.database import DbDependency
-from app.core.auth import CurrentUserClerkIdDependency, CurrentUserDependency, get_current_user
+from app.core.database import AsyncDbDependency
+from app.core.auth import CurrentUserClerkIdDependency, CurrentUserDependency, get_current_user, invalidate_cached_user
 from app.models import Citizenship, Relationship, Residence, User
 
 router = APIRouter()
@@ -65,31 +67,35 @@ class PCHICreate(PCHIBase):
 
 # Protected endpoint - requires authentication
 @router.post("/users", response_model=UserResponse)
-def create_user(
+async def create_user(
     userToAdd: UserCreate, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user_clerk_id: CurrentUserClerkIdDependency
 ) -> UserResponse:
     # Check if user already exists
-    user = db.query(User).filter(User.clerk_id == current_user_clerk_id).first()
+    result = await db.execute(select(User).where(User.clerk_id == current_user_clerk_id))
+    user = result.scalars().first()
     if user:
         raise HTTPException(status_code=400, detail="user already exists")
     
     user = User(**userToAdd.model_dump(), clerk_id=current_user_clerk_id)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await invalidate_cached_user(current_user_clerk_id)
+    # Relationships cannot be lazy loaded on an async session, so load threads for the response
+    await db.refresh(user, ["threads"])
     return user
 
 
 # Protected endpoint - requires authentication
 @router.get("/users/me", response_model=UserResponse)
 async def read_user(
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user_clerk_id: CurrentUserClerkIdDependency
 ):
     try:
         current_user = await get_current_user(current_user_clerk_id, db)
+        await db.refresh(current_user, ["threads"])
         return current_user
     except HTTPException as e:
         if e.status_code == 401: # Frontend uses this to direct user to onboarding page
@@ -98,25 +104,27 @@ async def read_user(
 
 # Protected endpoint - requires authentication
 @router.patch("/users/me", response_model=UserResponse)
-def update_user(
+async def update_user(
     user_info: UserUpdate, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     data_dict = user_info.model_dump(exclude_unset=True)
 
     for key, value in data_dict.items():
         setattr(current_user, key, value)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await invalidate_cached_user(current_user.clerk_id)
+    await db.refresh(current_user)
+    await db.refresh(current_user, ["threads"])
     return current_user
 
 
 # Protected endpoint - requires authentication
 @router.put("/users/me/pchi", response_model=UserResponse)
-def add_pchi_info(
+async def add_pchi_info(
     pchi_info: PCHICreate, 
-    db: DbDependency,
+    db: AsyncDbDependency,
     current_user: CurrentUserDependency
 ):
     current_user.household_size = pchi_info.household_size
@@ -124,6 +132,8 @@ def add_pchi_info(
     current_user.annual_property_value = pchi_info.annual_property_value
     current_user.monthly_pchi = pchi_info.monthly_pchi
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await invalidate_cached_user(current_user.clerk_id)
+    await db.refresh(current_user)
+    await db.refresh(current_user, ["threads"])
     return current_user
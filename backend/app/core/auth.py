@@ -1,24 +1,144 @@
-from cachetools import cached, TTLCache
-from typing import Annotated
+import asyncio
+from cachetools import LRUCache, TTLCache
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from typing import Annotated, Any, Dict, Optional, Tuple
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, Header, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import httpx
 from jose import jwt, JWTError
 import os
 
-from app.core.database import DbDependency
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.cache import Cache
+from app.core.database import AsyncDbDependency
 from app.models import User
+from app.util.http import request_with_retry
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
 CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL")
 CLERK_ISSUER = os.getenv("CLERK_JWT_ISSUER")
 
-@cached(cache=TTLCache(maxsize=1, ttl=3600))  # refresh every hour
-def get_jwks():
-    response = httpx.get(CLERK_JWKS_URL)
-    return response.json()
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))
+
+JWKS_REFRESH_INTERVAL = int(os.getenv("JWKS_REFRESH_INTERVAL", 3600))
+# Minimum seconds between refetches triggered by tokens signed with an unknown key
+JWKS_MIN_REFETCH_INTERVAL = int(os.getenv("JWKS_MIN_REFETCH_INTERVAL", 30))
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+# Verified tokens are trusted for at most this long, even if they expire later
+TOKEN_CACHE_MAX_TTL = int(os.getenv("TOKEN_CACHE_MAX_TTL", 300))
+
+# Shared secret for admin endpoints, sent in the X-Admin-Key header. Unset disables them.
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+# Signing keys are kept in memory for verification, and in the shared cache so that
+# workers pick up keys fetched by another worker before going to Clerk themselves
+_jwks: Optional[dict] = None
+_jwks_fetched_at = 0.0
+# Created on first use, so that it binds to the running event loop
+_jwks_lock: Optional[asyncio.Lock] = None
+_jwks_cache = Cache("jwks", ttl=2 * JWKS_REFRESH_INTERVAL)
+_jwks_refresh_task: Optional[asyncio.Task] = None
+
+def _key_ids(jwks: Optional[dict]) -> set:
+    return {key.get("kid") for key in (jwks or {}).get("keys", [])}
+
+async def refresh_jwks() -> dict:
+    """Fetch the signing keys from Clerk."""
+    global _jwks, _jwks_fetched_at
+    response = await request_with_retry("GET", CLERK_JWKS_URL)
+    response.raise_for_status()
+    _jwks = response.json()
+    _jwks_fetched_at = time.monotonic()
+    await _jwks_cache.set("keys", _jwks)
+    return _jwks
+
+async def get_jwks(kid: Optional[str] = None) -> dict:
+    """
+    Get the signing keys, fetching them only if none are loaded yet or if `kid` is
+    not among them (at most once per `JWKS_MIN_REFETCH_INTERVAL`, so that tokens
+    with made-up key IDs cannot flood Clerk).
+    """
+    global _jwks, _jwks_lock
+    if _jwks is not None and (kid is None or kid in _key_ids(_jwks)):
+        return _jwks
+
+    if _jwks_lock is None:
+        _jwks_lock = asyncio.Lock()
+    async with _jwks_lock:
+        if _jwks is not None and (kid is None or kid in _key_ids(_jwks)):
+            return _jwks
+
+        shared = await _jwks_cache.get("keys")
+        if shared is not None and (kid is None or kid in _key_ids(shared)):
+            _jwks = shared
+            return _jwks
+
+        if _jwks is None or time.monotonic() - _jwks_fetched_at >= JWKS_MIN_REFETCH_INTERVAL:
+            return await refresh_jwks()
+        return _jwks
+
+async def _refresh_jwks_periodically():
+    while True:
+        try:
+            await refresh_jwks()
+        except Exception as e:
+            # Keep using the current keys and try again on the next round
+            logger.warning("JWKS refresh failed: %s", e)
+        await asyncio.sleep(JWKS_REFRESH_INTERVAL)
+
+def start_jwks_refresh():
+    """Refresh the signing keys in the background, so that requests never wait on Clerk."""
+    global _jwks_refresh_task
+    if CLERK_JWKS_URL and _jwks_refresh_task is None:
+        _jwks_refresh_task = asyncio.create_task(_refresh_jwks_periodically())
+
+async def stop_jwks_refresh():
+    global _jwks_refresh_task
+    if _jwks_refresh_task is not None:
+        _jwks_refresh_task.cancel()
+        try:
+            await _jwks_refresh_task
+        except asyncio.CancelledError:
+            pass
+        _jwks_refresh_task = None
+
+# Verified tokens: SHA-256 of the token -> (claims, expiry as a unix time)
+_token_cache: LRUCache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+_token_cache_lock = threading.Lock()
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _get_cached_claims(token: str) -> Optional[dict]:
+    key = _token_key(token)
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del _token_cache[key]
+            return None
+        return claims
+
+def _cache_claims(token: str, claims: dict):
+    expires_at = time.time() + TOKEN_CACHE_MAX_TTL
+    if claims.get("exp") is not None:
+        expires_at = min(expires_at, float(claims["exp"]))
+    with _token_cache_lock:
+        _token_cache[_token_key(token)] = (claims, expires_at)
 
 async def get_current_user_clerk_id(
     credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)]
@@ -29,10 +149,15 @@ async def get_current_user_clerk_id(
             detail="Server configuration error"
         )
     
+    token = credentials.credentials
+    claims = _get_cached_claims(token)
+    if claims is not None:
+        return claims["sub"]
+
     try:
-        jwks = get_jwks()
+        jwks = await get_jwks(jwt.get_unverified_header(token).get("kid"))
         payload = jwt.decode(
-            credentials.credentials,
+            token,
             jwks,
             algorithms=["RS256"],
             issuer=CLERK_ISSUER,
@@ -52,14 +177,47 @@ async def get_current_user_clerk_id(
             headers={"WWW-Authenticate": "Bearer"}
         )
 
+    _cache_claims(token, payload)
     return clerk_id
 
 
+# Authenticated users, cached per process as clerk_id -> (version, column values).
+# Users hold decrypted personal data, so only their version is kept in the shared
+# cache; bumping it from any worker invalidates every worker's copy.
+_user_cache: TTLCache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+_user_versions = Cache("user-versions")
+
+async def _load_user(db: AsyncSession, clerk_id: str) -> Optional[User]:
+    version = await _user_versions.get(clerk_id)
+    with _user_cache_lock:
+        entry: Optional[Tuple[Any, Dict[str, Any]]] = _user_cache.get(clerk_id)
+
+    if entry is not None and entry[0] == version:
+        # Attach a copy to this session without querying, so that routes can update it
+        user = User(**entry[1])
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    result = await db.execute(select(User).where(User.clerk_id == clerk_id))
+    user = result.scalars().first()
+    if user is not None:
+        values = {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+        with _user_cache_lock:
+            _user_cache[clerk_id] = (version, values)
+    return user
+
+async def invalidate_cached_user(clerk_id: str):
+    """Drop the cached user, in this and every other worker. Call after writing to a user."""
+    with _user_cache_lock:
+        _user_cache.pop(clerk_id, None)
+    await _user_versions.incr(clerk_id)
+
 async def get_current_user(
     clerk_id: Annotated[str, Depends(get_current_user_clerk_id)],
-    db: DbDependency
+    db: AsyncDbDependency
 ) -> User:
-    user = db.query(User).filter(User.clerk_id == clerk_id).first()
+    user = await _load_user(db, clerk_id)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -70,5 +228,12 @@ async def get_current_user(
     return user
 
 
+async def verify_admin_key(x_admin_key: Annotated[Optional[str], Header()] = None):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key.encode(), ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
+
 CurrentUserClerkIdDependency = Annotated[str, Depends(get_current_user_clerk_id)]
 CurrentUserDependency = Annotated[User, Depends(get_current_user)]
@@ -0,0 +1,374 @@
+# Cache shared across worker processes, backed by Redis or (for a single process) by memory
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# e.g. redis://localhost:6379/0. Without it, each process caches in its own memory
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "carecompass")
+CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", 100000))
+
+# How long other callers wait for a value that one caller is computing, before computing it themselves
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("CACHE_SINGLE_FLIGHT_TIMEOUT", 10))
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05  # seconds
+
+
+class CacheBackend(ABC):
+    """
+    Key-value store of strings with per-key TTLs (in seconds, None for no expiry).
+    Keys are fully qualified; use `Cache` for namespacing and serialization.
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        ...
+
+    @abstractmethod
+    async def set_many(self, items: Sequence[Tuple[str, str]], ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Set the key only if it does not exist. Returns whether it was set."""
+
+    @abstractmethod
+    async def incr(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        ...
+
+    async def close(self):
+        pass
+
+
+class InMemoryBackend(CacheBackend):
+    """Process-local backend, for development and single-worker deployments."""
+
+    def __init__(self, maxsize: int = CACHE_MEMORY_MAX_ENTRIES):
+        self._lock = threading.Lock()
+        # key -> (value, expiry as a monotonic time or None)
+        self._entries: LRUCache = LRUCache(maxsize=maxsize)
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def _set(self, key: str, value: str, ttl: Optional[float]):
+        self._entries[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    async def set_many(self, items: Sequence[Tuple[str, str]], ttl: Optional[float] = None):
+        with self._lock:
+            for key, value in items:
+                self._set(key, value, ttl)
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    async def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._get(key) or 0) + 1
+            # Counters do not expire, like in Redis
+            self._set(key, str(value), None)
+            return value
+
+    async def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Backend for Redis or a Redis-compatible server.
+
+    Takes any client with the `redis.asyncio.Redis` interface, so tests can pass
+    a fake server's client (e.g. `fakeredis.aioredis.FakeRedis()`).
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        from redis.asyncio import Redis
+        return cls(Redis.from_url(url, decode_responses=True))
+
+    @staticmethod
+    def _decode(value) -> Optional[str]:
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return [self._decode(value) for value in await self._client.mget(list(keys))]
+
+    async def set_many(self, items: Sequence[Tuple[str, str]], ttl: Optional[float] = None):
+        if not items:
+            return
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key, value in items:
+                pipe.set(key, value, px=int(ttl * 1000) if ttl is not None else None)
+            await pipe.execute()
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return bool(await self._client.set(key, value, nx=True, px=int(ttl * 1000) if ttl is not None else None))
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*keys)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_backend: Optional[CacheBackend] = None
+
+def get_cache_backend() -> CacheBackend:
+    """Get the process-wide backend, chosen by `CACHE_URL` on first use."""
+    global _backend
+    if _backend is None:
+        _backend = RedisBackend.from_url(CACHE_URL) if CACHE_URL else InMemoryBackend()
+    return _backend
+
+def set_cache_backend(backend: Optional[CacheBackend]):
+    """Replace the process-wide backend, e.g. with one on a fake server in tests."""
+    global _backend
+    _backend = backend
+
+async def close_cache():
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
+
+
+class Cache:
+    """
+    A namespace of JSON-serializable values in the shared cache.
+
+    Keys are prefixed with `CACHE_KEY_PREFIX` and the namespace. If `versioned`,
+    keys also include a namespace version, and `clear` drops every key at once by
+    bumping the version (old entries are left to expire).
+
+    Backend errors are logged and treated as cache misses, so that an unavailable
+    cache server slows requests down rather than failing them.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: Optional[float] = None,
+        versioned: bool = False,
+        backend: Optional[CacheBackend] = None
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.versioned = versioned
+        self._backend = backend
+        # key -> future of the value being computed by this process (single-flight)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self._backend or get_cache_backend()
+
+    def _base_key(self, key: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:{self.namespace}:{key}"
+
+    async def _prefix(self) -> str:
+        if not self.versioned:
+            return self._base_key("")
+        version = (await self.backend.get_many([self._base_key("__version__")]))[0] or "0"
+        return self._base_key(f"v{version}:")
+
+    async def _read(self, prefix: str, keys: Sequence[str]) -> List[Any]:
+        try:
+            values = await self.backend.get_many([prefix + key for key in keys])
+        except Exception as e:
+            logger.warning("Cache read failed for %s: %s", self.namespace, e)
+            return [None] * len(keys)
+        return [json.loads(value) if value is not None else None for value in values]
+
+    async def _read_with_lock(self, prefix: str, key: str, lock_key: str) -> Tuple[Any, Optional[str]]:
+        """Read a value and its single-flight lock in one round trip. Errors count as a held lock."""
+        try:
+            value, lock = await self.backend.get_many([prefix + key, lock_key])
+        except Exception as e:
+            logger.warning("Cache read failed for %s: %s", self.namespace, e)
+            return None, "1"
+        return (json.loads(value) if value is not None else None), lock
+
+    async def _write(self, prefix: str, items: Dict[str, Any], ttl: Optional[float]):
+        try:
+            await self.backend.set_many(
+                [(prefix + key, json.dumps(value, separators=(",", ":"))) for key, value in items.items()],
+                ttl if ttl is not None else self.ttl
+            )
+        except Exception as e:
+            logger.warning("Cache write failed for %s: %s", self.namespace, e)
+
+    async def _safe_prefix(self) -> Optional[str]:
+        try:
+            return await self._prefix()
+        except Exception as e:
+            logger.warning("Cache version read failed for %s: %s", self.namespace, e)
+            return None
+
+    async def get_many(self, keys: Sequence[str]) -> List[Any]:
+        """Get the values of many keys in one round trip, with None for misses."""
+        prefix = await self._safe_prefix()
+        if prefix is None:
+            return [None] * len(keys)
+        return await self._read(prefix, keys)
+
+    async def get(self, key: str) -> Any:
+        return (await self.get_many([key]))[0]
+
+    async def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None):
+        prefix = await self._safe_prefix()
+        if prefix is not None:
+            await self._write(prefix, items, ttl)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.set_many({key: value}, ttl)
+
+    async def delete(self, *keys: str):
+        prefix = await self._safe_prefix()
+        if prefix is None:
+            return
+        try:
+            await self.backend.delete(*(prefix + key for key in keys))
+        except Exception as e:
+            logger.warning("Cache delete failed for %s: %s", self.namespace, e)
+
+    async def incr(self, key: str) -> Optional[int]:
+        """Increment a counter, e.g. a version number. Returns None if the backend failed."""
+        try:
+            return await self.backend.incr(self._base_key(key))
+        except Exception as e:
+            logger.warning("Cache increment failed for %s: %s", self.namespace, e)
+            return None
+
+    async def clear(self):
+        if not self.versioned:
+            raise RuntimeError(f"Cache namespace {self.namespace} is not versioned")
+        await self.incr("__version__")
+
+    async def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Get a value, computing and storing it on a miss.
+
+        Stampedes are avoided with single-flight: concurrent misses in this process
+        share one computation, and across processes the first to take a short lock
+        computes while the others poll for its result (up to `SINGLE_FLIGHT_TIMEOUT`).
+        `compute` returning None is not cached.
+
+        In a versioned namespace, the value is stored under the version read before
+        computing it, so a value computed across a `clear` is never served after it.
+        """
+        prefix = await self._safe_prefix()
+        if prefix is None:
+            return await compute()
+
+        value = (await self._read(prefix, [key]))[0]
+        if value is not None:
+            return value
+
+        full_key = prefix + key
+        inflight = self._inflight.get(full_key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Compute the value here if the caller computing it was cancelled
+                if not inflight.cancelled() or full_key in self._inflight:
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await self._compute_once(prefix, key, compute, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no other caller was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[full_key]
+
+    async def _compute_once(
+        self,
+        prefix: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float]
+    ) -> Any:
+        lock_key = f"{prefix}__lock__:{key}"
+        try:
+            locked = await self.backend.add(lock_key, "1", SINGLE_FLIGHT_TIMEOUT)
+        except Exception as e:
+            logger.warning("Cache lock failed for %s: %s", self.namespace, e)
+            locked = None
+
+        if locked is False:
+            # Another process may be computing the value; wait for it to appear, or
+            # for the lock to be released without it (e.g. if computing it failed)
+            deadline = time.monotonic() + SINGLE_FLIGHT_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+                value, lock = await self._read_with_lock(prefix, key, lock_key)
+                if value is not None:
+                    return value
+                if not lock:
+                    break
+
+        try:
+            value = await compute()
+            if value is not None:
+                await self._write(prefix, {key: value}, ttl)
+            return value
+        finally:
+            if locked:
+                try:
+                    await self.backend.delete(lock_key)
+                except Exception as e:
+                    logger.warning("Cache unlock failed for %s: %s", self.namespace, e)
@@ -2,26 +2,152 @@ from dotenv import load_dotenv
 load_dotenv() # Omit file path to let dotenv search for .env files automatically
 
 import os
+import threading
+import time
 from typing import Annotated
 from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-def build_dsn():
-    db_user = os.getenv("DB_USER")
-    db_password = os.getenv("DB_PASSWORD")
-    db_host = os.getenv("DB_HOST")
-    db_port = os.getenv("DB_PORT")
-    db_name = os.getenv("DB_NAME")
-    db_sslmode = os.getenv("DB_SSLMODE")
+def build_dsn(use_async: bool = False, prefix: str = "DB"):
+    """
+    Build a connection URL from `{prefix}_*` environment variables. Variables missing
+    for a non-default prefix (e.g. `DB_REPLICA_PORT`) fall back to the `DB_*` ones.
+    """
+    def env(name: str):
+        return os.getenv(f"{prefix}_{name}") or os.getenv(f"DB_{name}")
+
+    db_user = env("USER")
+    db_password = env("PASSWORD")
+    db_host = env("HOST")
+    db_port = env("PORT")
+    db_name = env("NAME")
+    db_sslmode = env("SSLMODE")
+
+    if use_async:
+        # asyncpg takes the libpq sslmode values through its `ssl` parameter
+        return f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}?ssl={db_sslmode}"
 
     return f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}?sslmode={db_sslmode}"
 
 DATABASE_URL = build_dsn()
+ASYNC_DATABASE_URL = build_dsn(use_async=True)
+
+# Optional read replica for read-only public endpoints, enabled by setting DB_REPLICA_HOST
+REPLICA_ENABLED = bool(os.getenv("DB_REPLICA_HOST"))
+ASYNC_REPLICA_DATABASE_URL = build_dsn(use_async=True, prefix="DB_REPLICA") if REPLICA_ENABLED else None
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds to wait for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds before a connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+class PoolMetrics:
+    """Cumulative connection checkout counters for a pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, wait_seconds: float, overflow: bool = False, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                if overflow:
+                    self.overflow_checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each connection checkout waits"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        # Only count checkouts that opened a connection beyond pool_size, not ones that
+        # reused a pooled connection while other overflow connections were open
+        overflow = connection.__dict__.pop("_metered_overflow", False)
+        self.metrics.record(time.perf_counter() - start, overflow=overflow)
+        return connection
+
+    def _create_connection(self):
+        # _do_get counts a new connection before creating it, so a positive
+        # overflow means this one is beyond pool_size
+        overflow = self._overflow > 0
+        record = super()._create_connection()
+        record._metered_overflow = overflow
+        return record
+
+    def recreate(self):
+        # Keep counting across pool recreation (e.g. after engine.dispose())
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            **self.metrics.snapshot(),
+        }
+
+class MeteredAsyncAdaptedQueuePool(MeteredQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING
+)
 
+# Synchronous engine, for migrations, scripts and jobs
 engine = create_engine(
     DATABASE_URL,
-    echo=os.getenv("ENV") == "development"
+    echo=os.getenv("ENV") == "development",
+    poolclass=MeteredQueuePool,
+    **POOL_OPTIONS
+)
+
+# Async engine, for route handlers
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=os.getenv("ENV") == "development",
+    poolclass=MeteredAsyncAdaptedQueuePool,
+    **POOL_OPTIONS
 )
 
 SessionLocal = sessionmaker(
@@ -39,3 +165,50 @@ def get_db():
         db.close()
 
 DbDependency = Annotated[Session, Depends(get_db)]
+
+# Async read replica engine, for read-only route handlers. Reads go to the
+# primary if no replica is configured.
+replica_async_engine = create_async_engine(
+    ASYNC_REPLICA_DATABASE_URL,
+    echo=os.getenv("ENV") == "development",
+    poolclass=MeteredAsyncAdaptedQueuePool,
+    **POOL_OPTIONS
+) if REPLICA_ENABLED else None
+
+# Objects are not expired on commit, since attributes cannot be lazily
+# reloaded outside of an awaited call. Use `await db.refresh(obj)` instead.
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine
+)
+
+# Async database dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+AsyncDbDependency = Annotated[AsyncSession, Depends(get_async_db)]
+
+ReadOnlyAsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    bind=replica_async_engine or async_engine
+)
+
+# Read-only database dependency. Replicas may lag slightly behind the primary,
+# so only use this for endpoints that tolerate stale reads and never write.
+async def get_read_only_db():
+    async with ReadOnlyAsyncSessionLocal() as db:
+        yield db
+
+ReadOnlyDbDependency = Annotated[AsyncSession, Depends(get_read_only_db)]
+
+def get_pool_stats() -> dict:
+    stats = {
+        "primary": engine.pool.stats(),
+        "primary_async": async_engine.pool.stats(),
+    }
+    if replica_async_engine is not None:
+        stats["replica_async"] = replica_async_engine.pool.stats()
+    return stats
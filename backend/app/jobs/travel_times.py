@@ -0,0 +1,194 @@
+"""
+Offline job to precompute travel times from residential postal codes to dementia daycare centres.
+
+Results are stored in `postal_code_travel_times`, which the recommendation endpoint
+reads before falling back to the Google Maps API.
+
+Usage:
+    python -m app.jobs.travel_times [--postal-codes FILE] [--nearest N] [--concurrency N]
+
+`FILE` is a CSV with a `postal_code` column and optional `lat`/`lng` columns (postal codes
+without coordinates are geocoded with OneMap). Without a file, the job uses the postal codes
+of registered care recipients and any postal codes already in the geocode cache.
+"""
+
+import argparse
+import asyncio
+import csv
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.database import AsyncSessionLocal, SessionLocal
+from app.models.care_receipient import CareReceipient
+from app.models.dementia_daycare import DementiaDaycare
+from app.models.geocode import GeocodeCache
+from app.models.travel_time import PostalCodeTravelTime
+from app.util.maps import POSTAL_CODE_PATTERN, getCoordFromAddress, getRouteDistancesByMode
+from app.util.spatial import SpatialIndex
+
+
+def read_postal_codes_csv(path: Path) -> Dict[str, Optional[Tuple[float, float]]]:
+    """Read postal codes and optional centroid coordinates from a CSV file."""
+    postal_codes: Dict[str, Optional[Tuple[float, float]]] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            postal_code = row["postal_code"].strip().zfill(6)
+            lat, lng = (row.get("lat") or "").strip(), (row.get("lng") or "").strip()
+            postal_codes[postal_code] = (float(lat), float(lng)) if lat and lng else None
+    return postal_codes
+
+
+def load_known_postal_codes(db: Session) -> Dict[str, Optional[Tuple[float, float]]]:
+    """Collect postal codes of care recipients and of previously geocoded addresses."""
+    postal_codes: Dict[str, Optional[Tuple[float, float]]] = {}
+
+    for (postal_code,) in db.query(CareReceipient.postal_code).distinct():
+        if postal_code is not None:
+            postal_codes[str(postal_code).zfill(6)] = None
+
+    for row in db.query(GeocodeCache).filter(GeocodeCache.lat.isnot(None)):
+        if POSTAL_CODE_PATTERN.fullmatch(row.query):
+            postal_codes[row.query] = (row.lat, row.lng)
+
+    return postal_codes
+
+
+async def geocode_missing(
+    postal_codes: Dict[str, Optional[Tuple[float, float]]]
+) -> Dict[str, Tuple[float, float]]:
+    """Fill in centroid coordinates with OneMap, dropping postal codes that cannot be found."""
+    located: Dict[str, Tuple[float, float]] = {}
+    # The geocode cache is shared with the API, which reads and writes it asynchronously
+    async with AsyncSessionLocal() as db:
+        for postal_code, coords in postal_codes.items():
+            if coords is None:
+                coords = await getCoordFromAddress(postal_code, db)
+            if coords is None:
+                print(f"  ! Skipping {postal_code}: not found on OneMap")
+                continue
+            located[postal_code] = coords
+    return located
+
+
+async def compute_travel_times(
+    postal_code: str,
+    origin: Tuple[float, float],
+    centers: List[DementiaDaycare],
+) -> List[dict]:
+    routes = await getRouteDistancesByMode(origin, [(center.lat, center.lng) for center in centers])
+    computed_at = datetime.now()
+    rows = []
+    for center, driving, transit in zip(centers, routes["driving"], routes["transit"]):
+        # Pairs without a route in either mode are left out, so that the API asks
+        # Google Maps again rather than serving them from the table
+        if driving is None or transit is None:
+            print(f"  ! No route from {postal_code} to centre {center.id}")
+            continue
+        rows.append({
+            "postal_code": postal_code,
+            "center_id": center.id,
+            "driving_distance": driving.distance,
+            "driving_duration": driving.duration,
+            "transit_duration": transit.duration,
+            "computed_at": computed_at,
+        })
+    return rows
+
+
+def save_travel_times(db: Session, rows: List[dict]) -> None:
+    if not rows:
+        return
+
+    stmt = insert(PostalCodeTravelTime).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PostalCodeTravelTime.postal_code, PostalCodeTravelTime.center_id],
+        set_={
+            "driving_distance": stmt.excluded.driving_distance,
+            "driving_duration": stmt.excluded.driving_duration,
+            "transit_duration": stmt.excluded.transit_duration,
+            "computed_at": stmt.excluded.computed_at,
+        }
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+async def precompute_travel_times(
+    postal_codes_file: Optional[Path] = None,
+    nearest: Optional[int] = None,
+    concurrency: int = 4,
+) -> None:
+    """
+    Precompute travel times from each postal code to every centre, or only to its
+    `nearest` centres by straight-line distance.
+    """
+    print("🚗 Precomputing postal code travel times...")
+
+    db = SessionLocal()
+    try:
+        centers = db.query(DementiaDaycare).filter(
+            DementiaDaycare.lat.isnot(None),
+            DementiaDaycare.lng.isnot(None)
+        ).all()
+        if not centers:
+            print("No centres to compute travel times to")
+            return
+
+        postal_codes = read_postal_codes_csv(postal_codes_file) if postal_codes_file \
+            else load_known_postal_codes(db)
+        origins = await geocode_missing(postal_codes)
+        if not origins:
+            print("No postal codes to compute travel times from")
+            return
+
+        # Shortlist centres for all postal codes at once
+        origin_postal_codes = list(origins.keys())
+        centers_by_id = {center.id: center for center in centers}
+        if nearest:
+            index = SpatialIndex()
+            index.load((center.id, center.lat, center.lng) for center in centers)
+            nearest_ids, _ = index.nearest_batch([origins[p] for p in origin_postal_codes], nearest)
+            targets = {
+                postal_code: [centers_by_id[int(id)] for id in ids]
+                for postal_code, ids in zip(origin_postal_codes, nearest_ids)
+            }
+        else:
+            targets = {postal_code: centers for postal_code in origin_postal_codes}
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(postal_code: str) -> None:
+            async with semaphore:
+                try:
+                    rows = await compute_travel_times(postal_code, origins[postal_code], targets[postal_code])
+                except Exception as e:
+                    print(f"  ! Failed for {postal_code}: {e}")
+                    return
+                save_travel_times(db, rows)
+
+        await asyncio.gather(*(run(postal_code) for postal_code in origin_postal_codes))
+
+        total = db.query(func.count()).select_from(PostalCodeTravelTime).scalar()
+        print(f"✓ Computed travel times for {len(origin_postal_codes)} postal codes ({total} rows stored)")
+
+    except Exception as e:
+        db.rollback()
+        print(f"\n❌ Error while precomputing travel times: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--postal-codes", type=Path, help="CSV file of postal codes (and optional lat/lng)")
+    parser.add_argument("--nearest", type=int, help="Only compute travel times to the N nearest centres")
+    parser.add_argument("--concurrency", type=int, default=4, help="Postal codes to process concurrently")
+    args = parser.parse_args()
+
+    asyncio.run(precompute_travel_times(args.postal_codes, args.nearest, args.concurrency))
@@ -2,10 +2,15 @@ from dotenv import load_dotenv
 load_dotenv() # Omit file path to let dotenv search for .env files automatically
 
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.api import router
+from app.core.auth import start_jwks_refresh, stop_jwks_refresh
+from app.core.cache import close_cache
+from app.util.http import close_http_client
+from app.util.pagination import NEXT_CURSOR_HEADER
 import sentry_sdk
 
 sentry_sdk.init(
@@ -21,8 +26,18 @@ sentry_sdk.init(
     },
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_jwks_refresh()
+    yield
+    await stop_jwks_refresh()
+    # Close pooled connections to external APIs
+    await close_http_client()
+    await close_cache()
+
 app = FastAPI(
     title="CareCompass API",
+    lifespan=lifespan,
 )
 
 # Authentication is handled via dependency injection in each route
@@ -48,6 +63,8 @@ app.add_middleware(
         "Content-Type",
         "X-Requested-With",
     ],
+    # Let the frontend read the cursor of the next page of list endpoints
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(router)
@@ -0,0 +1,32 @@
+"""add geocode cache
+
+Revision ID: 77b7558e6f06
+Revises: ccccb0459f5b
+Create Date: 2026-10-18 18:41:23.807114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '77b7558e6f06'
+down_revision: Union[str, None] = 'ccccb0459f5b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('geocode_cache',
+    sa.Column('query', sa.String(), nullable=False),
+    sa.Column('lat', sa.Float(), nullable=True),
+    sa.Column('lng', sa.Float(), nullable=True),
+    sa.Column('fetched_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('query')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('geocode_cache')
@@ -0,0 +1,37 @@
+"""add postal code travel times
+
+Revision ID: 788be358d954
+Revises: 77b7558e6f06
+Create Date: 2026-10-18 18:43:51.748016
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '788be358d954'
+down_revision: Union[str, None] = '77b7558e6f06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('postal_code_travel_times',
+    sa.Column('postal_code', sa.String(), nullable=False),
+    sa.Column('center_id', sa.Integer(), nullable=False),
+    sa.Column('driving_distance', sa.Integer(), nullable=False),
+    sa.Column('driving_duration', sa.Integer(), nullable=False),
+    sa.Column('transit_duration', sa.Integer(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['center_id'], ['dementia_daycare.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('postal_code', 'center_id')
+    )
+    op.create_index(op.f('ix_postal_code_travel_times_center_id'), 'postal_code_travel_times', ['center_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_postal_code_travel_times_center_id'), table_name='postal_code_travel_times')
+    op.drop_table('postal_code_travel_times')
@@ -0,0 +1,56 @@
+"""add review aggregates
+
+Revision ID: 0764df0a0e07
+Revises: 788be358d954
+Create Date: 2026-10-18 18:45:47.953226
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0764df0a0e07'
+down_revision: Union[str, None] = '788be358d954'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('review_aggregates',
+    sa.Column('target_type', postgresql.ENUM(name='reviewabletype', create_type=False), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('review_count', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), nullable=False),
+    sa.Column('average_rating', sa.Float(), nullable=False),
+    sa.Column('rating_1_count', sa.Integer(), nullable=False),
+    sa.Column('rating_2_count', sa.Integer(), nullable=False),
+    sa.Column('rating_3_count', sa.Integer(), nullable=False),
+    sa.Column('rating_4_count', sa.Integer(), nullable=False),
+    sa.Column('rating_5_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('target_type', 'target_id')
+    )
+
+    # Backfill from existing reviews
+    op.execute("""
+        INSERT INTO review_aggregates (
+            target_type, target_id, review_count, rating_sum, average_rating,
+            rating_1_count, rating_2_count, rating_3_count, rating_4_count, rating_5_count
+        )
+        SELECT
+            target_type, target_id, count(*), sum(overall_rating), avg(overall_rating),
+            count(*) FILTER (WHERE overall_rating = 1),
+            count(*) FILTER (WHERE overall_rating = 2),
+            count(*) FILTER (WHERE overall_rating = 3),
+            count(*) FILTER (WHERE overall_rating = 4),
+            count(*) FILTER (WHERE overall_rating = 5)
+        FROM reviews
+        GROUP BY target_type, target_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('review_aggregates')
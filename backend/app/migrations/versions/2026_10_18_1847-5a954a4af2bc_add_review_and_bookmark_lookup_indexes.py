@@ -0,0 +1,49 @@
+"""add review and bookmark lookup indexes
+
+Revision ID: 5a954a4af2bc
+Revises: 0764df0a0e07
+Create Date: 2026-10-18 18:47:49.116346
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a954a4af2bc'
+down_revision: Union[str, None] = '0764df0a0e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The unique index cannot be built over duplicate Google reviews. Rather than pick
+    # which copies to delete here, stop and leave that to whoever runs the migration.
+    duplicates = op.get_bind().execute(sa.text("""
+        SELECT google_review_id, count(*) AS copies
+        FROM reviews
+        WHERE google_review_id IS NOT NULL
+        GROUP BY google_review_id
+        HAVING count(*) > 1
+        ORDER BY google_review_id
+        LIMIT 10
+    """)).all()
+    if duplicates:
+        raise RuntimeError(
+            "Cannot add a unique index on reviews.google_review_id: some Google reviews "
+            "are stored more than once, e.g. "
+            + ", ".join(f"{review_id} ({copies} copies)" for review_id, copies in duplicates)
+            + ". Delete the extra rows (and update review_aggregates to match), then rerun the migration."
+        )
+
+    op.create_index('ix_reviews_target_type_target_id_published_time', 'reviews', ['target_type', 'target_id', 'published_time'], unique=False)
+    op.create_index(op.f('ix_reviews_google_review_id'), 'reviews', ['google_review_id'], unique=True)
+    op.create_index('ix_bookmarks_user_id_target_type_target_id', 'bookmarks', ['user_id', 'target_type', 'target_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bookmarks_user_id_target_type_target_id', table_name='bookmarks')
+    op.drop_index(op.f('ix_reviews_google_review_id'), table_name='reviews')
+    op.drop_index('ix_reviews_target_type_target_id_published_time', table_name='reviews')
@@ -0,0 +1,42 @@
+"""add thread messages
+
+Revision ID: d7b41709da65
+Revises: 5a954a4af2bc
+Create Date: 2026-10-18 18:59:01.060615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7b41709da65'
+down_revision: Union[str, None] = '5a954a4af2bc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('threads', sa.Column('last_message_id', sa.String(), nullable=True))
+    op.add_column('threads', sa.Column('messages_synced', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_table('thread_messages',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('thread_id', sa.String(), nullable=False),
+    sa.Column('message_id', sa.String(), nullable=False),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['thread_id'], ['threads.thread_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('message_id')
+    )
+    op.create_index('ix_thread_messages_thread_id_id', 'thread_messages', ['thread_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_thread_messages_thread_id_id', table_name='thread_messages')
+    op.drop_table('thread_messages')
+    op.drop_column('threads', 'messages_synced')
+    op.drop_column('threads', 'last_message_id')
@@ -6,4 +6,6 @@ from app.models.dementia_daycare import *
 from app.models.review import *
 from app.models.bookmark import *
 from app.models.care_receipient import *
-from app.models.mood import *
\ No newline at end of file
+from app.models.mood import *
+from app.models.geocode import *
+from app.models.travel_time import *
\ No newline at end of file
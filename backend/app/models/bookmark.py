@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String
+from sqlalchemy import Index, Integer, String
 from sqlalchemy import Enum as SQLAlchemyEnum
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -9,6 +9,10 @@ from app.models.review import ReviewableType
 
 class Bookmark(Base):
     __tablename__ = "bookmarks"
+    __table_args__ = (
+        # A user's bookmarks, optionally of a given target
+        Index("ix_bookmarks_user_id_target_type_target_id", "user_id", "target_type", "target_id"),
+    )
 
     id: Mapped[int] = mapped_column(
         Integer,
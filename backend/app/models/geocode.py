@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import DateTime, Float, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+
+    # Normalised address, or the 6-digit postal code if the address contains one
+    query: Mapped[str] = mapped_column(String, primary_key=True)
+    # Both null if the address could not be found (negative result)
+    lat: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    lng: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    fetched_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
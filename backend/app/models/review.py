@@ -1,9 +1,11 @@
 from enum import Enum
 from datetime import datetime
-from typing import Optional
-from sqlalchemy import DateTime, Integer, String, func
+from typing import List, Optional
+from sqlalchemy import DateTime, Float, Index, Integer, String, case, cast, delete, func, insert, select, update
 from sqlalchemy import Enum as SQLAlchemyEnum
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Mapped, Session, mapped_column
+from sqlalchemy.sql import Executable
 
 from app.models.base import Base
 from app.models.util import use_enum_values
@@ -18,6 +20,10 @@ class ReviewSource(str, Enum):
 
 class Review(Base):
     __tablename__ = "reviews"
+    __table_args__ = (
+        # Reviews of a target, newest first
+        Index("ix_reviews_target_type_target_id_published_time", "target_type", "target_id", "published_time"),
+    )
 
     id: Mapped[int] = mapped_column(
         Integer,
@@ -39,10 +45,108 @@ class Review(Base):
     # Attributions
     author_name: Mapped[str] = mapped_column(String)
     author_id: Mapped[Optional[str]] = mapped_column(String, nullable=True) # in-app id
-    google_review_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    google_review_id: Mapped[Optional[str]] = mapped_column(String, nullable=True, unique=True, index=True)
     google_author_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     google_author_photo_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
     # Metadata
     # Overriden if review is from 3rd party source, else defaults to server time
     published_time: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+
+# Ratings are on a 1 to 5 scale
+RATING_VALUES = range(1, 6)
+
+class ReviewAggregate(Base):
+    """Rating summary per reviewable target, maintained as reviews are written"""
+    __tablename__ = "review_aggregates"
+
+    target_type: Mapped[ReviewableType] = mapped_column(
+        SQLAlchemyEnum(ReviewableType, values_callable=use_enum_values),
+        primary_key=True
+    )
+    target_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    review_count: Mapped[int] = mapped_column(Integer, default=0)
+    rating_sum: Mapped[int] = mapped_column(Integer, default=0)
+    average_rating: Mapped[float] = mapped_column(Float, default=0)
+    # Rating histogram
+    rating_1_count: Mapped[int] = mapped_column(Integer, default=0)
+    rating_2_count: Mapped[int] = mapped_column(Integer, default=0)
+    rating_3_count: Mapped[int] = mapped_column(Integer, default=0)
+    rating_4_count: Mapped[int] = mapped_column(Integer, default=0)
+    rating_5_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    @property
+    def rating_histogram(self) -> List[int]:
+        """Review counts for ratings 1 to 5"""
+        return [getattr(self, f"rating_{rating}_count") for rating in RATING_VALUES]
+
+
+def review_aggregate_update(
+    target_type: ReviewableType,
+    target_id: int,
+    rating: int,
+    delta: int
+) -> Executable:
+    """
+    Build a statement that adds (`delta` = 1) or removes (`delta` = -1) a review with
+    the given rating from its target's aggregate. Execute it in the same transaction
+    as the review write.
+    """
+    columns = {
+        "review_count": ReviewAggregate.review_count + delta,
+        "rating_sum": ReviewAggregate.rating_sum + delta * rating,
+        "average_rating": func.coalesce(
+            cast(ReviewAggregate.rating_sum + delta * rating, Float)
+            / cast(func.nullif(ReviewAggregate.review_count + delta, 0), Float),
+            0
+        ),
+    }
+    if rating in RATING_VALUES:
+        histogram_column = getattr(ReviewAggregate, f"rating_{rating}_count")
+        columns[histogram_column.key] = histogram_column + delta
+
+    if delta < 0:
+        return update(ReviewAggregate).where(
+            ReviewAggregate.target_type == target_type,
+            ReviewAggregate.target_id == target_id
+        ).values(**columns)
+
+    values = {
+        "target_type": target_type,
+        "target_id": target_id,
+        "review_count": delta,
+        "rating_sum": delta * rating,
+        "average_rating": rating,
+        **{f"rating_{value}_count": delta if value == rating else 0 for value in RATING_VALUES},
+    }
+    return pg_insert(ReviewAggregate).values(**values).on_conflict_do_update(
+        index_elements=[ReviewAggregate.target_type, ReviewAggregate.target_id],
+        set_=columns
+    )
+
+
+def rebuild_review_aggregates(db: Session):
+    """Recompute all review aggregates from the reviews table, e.g. after bulk imports."""
+    db.execute(delete(ReviewAggregate))
+    db.execute(insert(ReviewAggregate).from_select(
+        [
+            "target_type",
+            "target_id",
+            "review_count",
+            "rating_sum",
+            "average_rating",
+            *[f"rating_{rating}_count" for rating in RATING_VALUES],
+        ],
+        select(
+            Review.target_type,
+            Review.target_id,
+            func.count(),
+            func.sum(Review.overall_rating),
+            func.avg(Review.overall_rating),
+            *[
+                func.sum(case((Review.overall_rating == rating, 1), else_=0))
+                for rating in RATING_VALUES
+            ],
+        ).group_by(Review.target_type, Review.target_id)
+    ))
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, Column, ForeignKey
+from sqlalchemy import Boolean, Integer, String, Text, Column, ForeignKey, Index, false
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -9,4 +9,36 @@ class Thread(Base):
     user_id = Column(String, ForeignKey("users.clerk_id"))
     title = Column(String)
 
+    # OpenAI ID of the newest message in the local message store
+    last_message_id = Column(String, nullable=True)
+    # Whether the local message store has every message of the OpenAI thread.
+    # If not, it is synced from `last_message_id` the next time the thread is read.
+    messages_synced = Column(Boolean, nullable=False, default=False, server_default=false())
+
     user = relationship("User", back_populates="threads")
+    messages = relationship(
+        "ThreadMessage",
+        back_populates="thread",
+        order_by="ThreadMessage.id",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
+
+class ThreadMessage(Base):
+    """Local copy of a message in an OpenAI thread, with citations removed"""
+    __tablename__ = "thread_messages"
+    __table_args__ = (
+        Index("ix_thread_messages_thread_id_id", "thread_id", "id"),
+    )
+
+    # Messages are stored in thread order, so this also orders them
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    thread_id = Column(String, ForeignKey("threads.thread_id", ondelete="CASCADE"), nullable=False)
+    message_id = Column(String, nullable=False, unique=True)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    # Unix timestamp from OpenAI
+    created_at = Column(Integer, nullable=False)
+
+    thread = relationship("Thread", back_populates="messages")
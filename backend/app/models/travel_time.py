@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlalchemy import DateTime, ForeignKey, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+class PostalCodeTravelTime(Base):
+    """Precomputed travel from a postal code centroid to a dementia daycare centre"""
+    __tablename__ = "postal_code_travel_times"
+
+    postal_code: Mapped[str] = mapped_column(String, primary_key=True)
+    center_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("dementia_daycare.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True
+    )
+    # Distances in metres, durations in seconds
+    driving_distance: Mapped[int] = mapped_column(Integer)
+    driving_duration: Mapped[int] = mapped_column(Integer)
+    transit_duration: Mapped[int] = mapped_column(Integer)
+    computed_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
@@ -0,0 +1,52 @@
+# Cache of assistant answers to the first message of a thread, keyed by the normalized query
+
+import hashlib
+import os
+import re
+import unicodedata
+from typing import Optional
+
+from app.core.cache import Cache
+
+# Seconds an answer is reused; 0 disables the cache
+CHAT_ANSWER_CACHE_TTL = int(os.getenv("CHAT_ANSWER_CACHE_TTL", 86400))
+# Longer queries are too specific to be asked again
+CHAT_ANSWER_CACHE_MAX_QUERY_LENGTH = 300
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+_answers = Cache("chat-answers", ttl=CHAT_ANSWER_CACHE_TTL, versioned=True)
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, Unicode forms, punctuation and whitespace, so that trivially different queries match."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(_PUNCTUATION.sub(" ", query).split())
+
+
+def _answer_key(query: str) -> Optional[str]:
+    if CHAT_ANSWER_CACHE_TTL <= 0:
+        return None
+    normalized = normalize_query(query)
+    if not normalized or len(normalized) > CHAT_ANSWER_CACHE_MAX_QUERY_LENGTH:
+        return None
+    # Answers also depend on the assistant's instructions and files, so switching
+    # assistants starts afresh
+    assistant_id = os.getenv("OPENAI_ASSISTANT_ID", "")
+    return hashlib.sha256(f"{assistant_id}\n{normalized}".encode()).hexdigest()
+
+
+async def get_cached_answer(query: str) -> Optional[str]:
+    key = _answer_key(query)
+    return await _answers.get(key) if key else None
+
+
+async def cache_answer(query: str, answer: str):
+    key = _answer_key(query)
+    if key and answer:
+        await _answers.set(key, answer)
+
+
+async def clear_answer_cache():
+    """Drop every cached answer, e.g. after the assistant's knowledge base changes."""
+    await _answers.clear()
@@ -0,0 +1,89 @@
+# Shared async HTTP client for calls to external APIs (OneMap, Google Maps, ...)
+
+import asyncio
+import os
+import random
+from typing import Optional
+
+import httpx
+
+HTTP_TIMEOUT = httpx.Timeout(
+    float(os.getenv("HTTP_TIMEOUT", 10)),
+    connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+)
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)),
+    keepalive_expiry=30,
+)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+HTTP_BACKOFF_BASE = 0.25  # seconds, doubled on each retry
+HTTP_BACKOFF_MAX = 4.0
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide async HTTP client. Connections are kept alive and pooled
+    across requests, so callers must not close the returned client.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _backoff_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    # Honour Retry-After (in seconds) if the server sent one
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+
+    delay = min(HTTP_BACKOFF_BASE * (2 ** attempt), HTTP_BACKOFF_MAX)
+    # Full jitter, so that concurrent retries do not hit the server in lockstep
+    return random.uniform(0, delay)
+
+async def request_with_retry(
+    method: str,
+    url: str,
+    max_retries: int = HTTP_MAX_RETRIES,
+    **kwargs
+) -> httpx.Response:
+    """
+    Send a request with the shared client, retrying with exponential backoff on
+    connection errors, timeouts and retryable status codes (429 and 5xx).
+
+    Args:
+        - method (str): HTTP method
+        - url (str): Request URL
+        - max_retries (int): Number of retries after the first attempt
+        - **kwargs: Passed through to `httpx.AsyncClient.request`
+
+    Returns:
+        - httpx.Response: The last response received. Callers should check its status.
+
+    Raises:
+        - httpx.TransportError: If the last attempt failed to get a response
+    """
+    client = get_http_client()
+    for attempt in range(max_retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+            continue
+
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+            return response
+
+        await asyncio.sleep(_backoff_delay(attempt, response))
@@ -1,42 +1,262 @@
+import asyncio
 import os
-import requests
+import re
+import threading
 
-from typing import Tuple, Union
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from cachetools import LRUCache
 from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from googlemaps import Client as GoogleMapsClient
+from app.core.cache import Cache
+from app.models.geocode import GeocodeCache
+from app.util.http import request_with_retry
 
 # TODO: Add return type hints
 
-def getCoordFromAddress(address: str) -> Union[Tuple[float, float], None]:
+ONEMAP_SEARCH_URL = "https://www.onemap.gov.sg/api/common/elastic/search"
+GOOGLE_DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+# Google allows at most 25 origins or destinations per Distance Matrix request
+DISTANCE_MATRIX_MAX_DESTINATIONS = 25
+
+ROUTE_CACHE_TTL = int(os.getenv("ROUTE_CACHE_TTL", 7 * 24 * 3600))
+# Routes are cached per block of hours of the day (Singapore time), split by weekday/weekend
+ROUTE_CACHE_BUCKET_HOURS = int(os.getenv("ROUTE_CACHE_BUCKET_HOURS", 3))
+# Origins are rounded to 3 decimal places (~100 m), so neighbouring homes share entries
+ROUTE_CACHE_ORIGIN_PRECISION = 3
+ROUTE_CACHE_DESTINATION_PRECISION = 5
+
+SGT = timezone(timedelta(hours=8))
+
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 10000))
+GEOCODE_CACHE_TTL = timedelta(seconds=int(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600)))
+# Addresses that could not be found are retried sooner, in case OneMap adds them
+GEOCODE_NEGATIVE_CACHE_TTL = timedelta(seconds=int(os.getenv("GEOCODE_NEGATIVE_CACHE_TTL", 24 * 3600)))
+
+POSTAL_CODE_PATTERN = re.compile(r"(?<!\d)(\d{6})(?!\d)")
+
+# Hot tier, so that repeat lookups never leave the process: normalised query -> (coords or None, expiry)
+_local_geocode_cache: LRUCache = LRUCache(maxsize=GEOCODE_CACHE_SIZE)
+_local_geocode_cache_lock = threading.Lock()
+# Shared tier, so that workers reuse each other's lookups:
+# normalised query -> {"coords": [lat, lng] or None, "expires_at": unix time}
+_geocode_cache = Cache("geocode")
+
+def normalize_address(address: str) -> str:
     """
-    Get the latitude and longitude of an address using OneMap API.
+    Normalise an address into a geocode cache key.
+    Singapore postal codes identify a single building, so an address containing
+    one is keyed on the postal code alone.
+    """
+    match = POSTAL_CODE_PATTERN.search(address)
+    if match:
+        return match.group(1)
+    return " ".join(address.upper().split())
 
-    Args:
-        address (str): The address to search for
+def _cache_expiry(fetched_at: datetime, coords: Optional[Tuple[float, float]]) -> datetime:
+    return fetched_at + (GEOCODE_CACHE_TTL if coords else GEOCODE_NEGATIVE_CACHE_TTL)
 
-    Returns:
-        Tuple[float, float]: The latitude and longitude of the address
+def _set_local_coord(key: str, coords: Optional[Tuple[float, float]], expires_at: datetime):
+    with _local_geocode_cache_lock:
+        _local_geocode_cache[key] = (coords, expires_at)
+
+async def _get_cached_coord(key: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+    with _local_geocode_cache_lock:
+        local_entry = _local_geocode_cache.get(key)
+    if local_entry is not None and local_entry[1] > datetime.now():
+        return True, local_entry[0]
+
+    entry = await _geocode_cache.get(key)
+    if entry is None:
+        return False, None
+
+    coords = tuple(entry["coords"]) if entry["coords"] else None
+    # Entries without an expiry are kept locally only as long as a negative lookup
+    expires_at = datetime.fromtimestamp(entry["expires_at"]) if "expires_at" in entry \
+        else datetime.now() + GEOCODE_NEGATIVE_CACHE_TTL
+    _set_local_coord(key, coords, expires_at)
+    return True, coords
+
+async def _set_cached_coord(key: str, coords: Optional[Tuple[float, float]], fetched_at: datetime):
+    expires_at = _cache_expiry(fetched_at, coords)
+    ttl = (expires_at - datetime.now()).total_seconds()
+    if ttl > 0:
+        _set_local_coord(key, coords, expires_at)
+        await _geocode_cache.set(key, {
+            "coords": list(coords) if coords else None,
+            "expires_at": expires_at.timestamp(),
+        }, ttl)
+
+class MapsApiError(Exception):
+    pass
+
+async def searchOneMap(query: str) -> Union[Tuple[float, float], None]:
+    """
+    Look up the latitude and longitude of a search term using OneMap API, bypassing the cache.
     """
-    url = f"https://www.onemap.gov.sg/api/common/elastic/search?searchVal={address}&returnGeom=Y&getAddrDetails=Y&pageNum=1"
-    response = requests.get(url)
+    response = await request_with_retry("GET", ONEMAP_SEARCH_URL, params={
+        "searchVal": query,
+        "returnGeom": "Y",
+        "getAddrDetails": "Y",
+        "pageNum": 1,
+    })
+    response.raise_for_status()
     data = response.json()
     if data['found'] == 0:
         return None
 
-    print(address, data['results'][0]['LATITUDE'], data['results'][0]['LONGITUDE'], end='\n\n')
     return (float(data['results'][0]['LATITUDE']), float(data['results'][0]['LONGITUDE']))
 
+async def getCoordFromAddress(address: str, db: Optional[AsyncSession] = None) -> Union[Tuple[float, float], None]:
+    """
+    Get the latitude and longitude of an address using OneMap API.
+
+    Lookups are cached on the normalised address (see `normalize_address`), first in an
+    in-process LRU, then in the shared cache and then in the `geocode_cache` table if a
+    session is given.
+    Addresses that OneMap cannot find are cached too, for a shorter TTL.
+
+    Args:
+        - address (str): The address to search for
+        - db (Optional[AsyncSession]): Session for the persistent cache tier
+
+    Returns:
+        - Tuple[float, float]: The latitude and longitude of the address, or None if not found
+    """
+    key = normalize_address(address)
+    if not key:
+        return None
+
+    hit, coords = await _get_cached_coord(key)
+    if hit:
+        return coords
+
+    if db is not None:
+        row = await db.get(GeocodeCache, key)
+        if row is not None:
+            coords = (row.lat, row.lng) if row.lat is not None and row.lng is not None else None
+            if _cache_expiry(row.fetched_at, coords) > datetime.now():
+                await _set_cached_coord(key, coords, row.fetched_at)
+                return coords
+
+    coords = await searchOneMap(key)
+    fetched_at = datetime.now()
+    await _set_cached_coord(key, coords, fetched_at)
+
+    if db is not None:
+        try:
+            await db.merge(GeocodeCache(
+                query=key,
+                lat=coords[0] if coords else None,
+                lng=coords[1] if coords else None,
+                fetched_at=fetched_at
+            ))
+            await db.commit()
+        except IntegrityError:
+            # Another request cached the same address first
+            await db.rollback()
+
+    return coords
+
 class RouteDistance(BaseModel):
     distance: int
     duration: int
 
-# TODO: make this async
-def getRouteDistance(
+def _format_location(location: Union[str, Tuple[float, float]]) -> str:
+    if isinstance(location, str):
+        return location
+    return f"{location[0]},{location[1]}"
+
+# "origin|destination|mode|departure bucket" -> {"distance": ..., "duration": ...}
+_route_cache = Cache("routes", ttl=ROUTE_CACHE_TTL)
+
+def _location_cache_key(location: Union[str, Tuple[float, float]], precision: int) -> str:
+    if isinstance(location, str):
+        return normalize_address(location)
+    return f"{round(location[0], precision)},{round(location[1], precision)}"
+
+def _departure_bucket(now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(SGT)
+    day_type = "weekend" if now.weekday() >= 5 else "weekday"
+    return f"{day_type}:{now.hour // ROUTE_CACHE_BUCKET_HOURS}"
+
+async def getRouteDistances(
+    origin: Union[str, Tuple[float, float]],
+    destinations: Sequence[Union[str, Tuple[float, float]]],
+    mode: str = "driving"
+) -> List[Optional[RouteDistance]]:
+    """
+    Get the distances from one origin to many destinations using Google Maps API.
+    Destinations are sent in a single Distance Matrix request (or one per
+    `DISTANCE_MATRIX_MAX_DESTINATIONS` destinations, sent concurrently).
+
+    Routes are cached by rounded origin, destination, mode and departure time
+    bucket for `ROUTE_CACHE_TTL` seconds; only uncached destinations are requested.
+
+    Args:
+        - origin (Union[str, Tuple[float, float]]): The origin location (address or lat/lng coordinates)
+        - destinations (Sequence[Union[str, Tuple[float, float]]]): The destination locations (addresses or lat/lng coordinates)
+        - mode (str): The mode of transport to use when calculating directions.
+        Valid values are "driving", "walking", "transit" or "bicycling". Defaults to "driving"
+
+    Returns:
+        - List[Optional[RouteDistance]]: The distance and estimated travel duration to each
+        destination, in order, or None for destinations that cannot be reached by this mode
+    """
+    origin_key = _location_cache_key(origin, ROUTE_CACHE_ORIGIN_PRECISION)
+    bucket = _departure_bucket()
+    keys = [
+        f"{origin_key}|{_location_cache_key(destination, ROUTE_CACHE_DESTINATION_PRECISION)}|{mode}|{bucket}"
+        for destination in destinations
+    ]
+
+    routes: List[Optional[RouteDistance]] = [
+        RouteDistance(**cached) if cached else None
+        for cached in await _route_cache.get_many(keys)
+    ]
+    misses = [i for i, route in enumerate(routes) if route is None]
+    if misses:
+        chunks = [
+            misses[i:i + DISTANCE_MATRIX_MAX_DESTINATIONS]
+            for i in range(0, len(misses), DISTANCE_MATRIX_MAX_DESTINATIONS)
+        ]
+        results = await asyncio.gather(*(
+            _fetchDistanceMatrix(origin, [destinations[i] for i in chunk], mode) for chunk in chunks
+        ))
+        fetched = {}
+        for chunk, result in zip(chunks, results):
+            for i, route in zip(chunk, result):
+                # Unroutable pairs are not cached, so they are retried on the next request
+                if route is not None:
+                    fetched[keys[i]] = route.model_dump()
+                routes[i] = route
+        await _route_cache.set_many(fetched)
+
+    return routes
+
+async def getRouteDistancesByMode(
+    origin: Union[str, Tuple[float, float]],
+    destinations: Sequence[Union[str, Tuple[float, float]]],
+    modes: Sequence[str] = ("driving", "transit")
+) -> Dict[str, List[Optional[RouteDistance]]]:
+    """
+    Get the distances from one origin to many destinations for several modes of transport,
+    with one concurrent Distance Matrix request per mode.
+
+    Returns:
+        - Dict[str, List[Optional[RouteDistance]]]: For each mode, the routes to each destination
+        in order (None if unroutable)
+    """
+    results = await asyncio.gather(*(getRouteDistances(origin, destinations, mode) for mode in modes))
+    return dict(zip(modes, results))
+
+async def getRouteDistance(
     origin: Union[str, Tuple[float, float]],
     destination: Union[str, Tuple[float, float]],
     mode: str = "driving"
-) -> RouteDistance:
+) -> Optional[RouteDistance]:
     """
     Get the distance between two locations using Google Maps API.
 
@@ -47,22 +267,35 @@ def getRouteDistance(
         Valid values are "driving", "walking", "transit" or "bicycling". Defaults to "driving"
 
     Returns:
-        - RouteDistance: The distance between the two locations and the estimated travel duration
+        - Optional[RouteDistance]: The distance between the two locations and the estimated
+        travel duration, or None if there is no route
     """
-    gmaps = GoogleMapsClient(key=os.getenv('GOOGLE_MAPS_API_KEY'))
-    dist = gmaps.distance_matrix(
-        origins=[origin],
-        destinations=[destination],
-        mode=mode,
-        transit_routing_preference=["less_walking", "fewer_transfers"]
-    )
-
-    route = dist.get('rows')[0].get('elements')[0]
-
-    if route.get('status') != "OK":
-        return RouteDistance(distance=0, duration=0)
-
-    return RouteDistance(
-        distance=route.get('distance').get('value'),
-        duration=route.get('duration').get('value')
-    )
+    return (await getRouteDistances(origin, [destination], mode))[0]
+
+async def _fetchDistanceMatrix(
+    origin: Union[str, Tuple[float, float]],
+    destinations: Sequence[Union[str, Tuple[float, float]]],
+    mode: str
+) -> List[Optional[RouteDistance]]:
+    response = await request_with_retry("GET", GOOGLE_DISTANCE_MATRIX_URL, params={
+        "origins": _format_location(origin),
+        "destinations": "|".join(_format_location(destination) for destination in destinations),
+        "mode": mode,
+        "transit_routing_preference": "less_walking|fewer_transfers",
+        "key": os.getenv('GOOGLE_MAPS_API_KEY'),
+    })
+    response.raise_for_status()
+    dist = response.json()
+    if dist.get('status') != "OK":
+        raise MapsApiError(f"Distance Matrix request failed: {dist.get('status')} {dist.get('error_message', '')}".strip())
+
+    routes = []
+    for route in dist.get('rows')[0].get('elements'):
+        if route.get('status') != "OK":
+            routes.append(None)
+        else:
+            routes.append(RouteDistance(
+                distance=route.get('distance').get('value'),
+                duration=route.get('duration').get('value')
+            ))
+    return routes
@@ -3,13 +3,15 @@
 import asyncio
 import json
 import os
-import re
 
-from app.core.database import *
-from typing import AsyncGenerator
-from openai import OpenAI
+from app.core.database import AsyncSessionLocal
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Sequence
+from openai import AsyncOpenAI, AsyncStream, OpenAIError, RateLimitError
+from openai.types.beta.threads import Message
 from openai.types.beta.assistant_stream_event import (
+    ThreadMessageCompleted,
     ThreadMessageDelta,
+    ThreadRunCreated,
     ThreadRunFailed,
     ThreadRunCancelling,
     ThreadRunCancelled,
@@ -18,16 +20,185 @@ from openai.types.beta.assistant_stream_event import (
     ThreadRunStepCancelled,
 )
 
-client = OpenAI()
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-async def stream_chat_responses(thread_id: str, query: str) -> AsyncGenerator[str, None]:
-    client.beta.threads.messages.create(
+from app.models.thread import Thread, ThreadMessage
+from app.util.answer_cache import cache_answer
+from app.util.run_scheduler import CHAT_RUN_MAX_RETRIES, RunTicket, retry_delay
+
+client = AsyncOpenAI()
+
+# Tokens are sent in batches, when this many milliseconds have passed since the first
+# buffered token or this many bytes are buffered. Set CHAT_STREAM_FLUSH_MS to 0 to
+# send every token as its own event.
+CHAT_STREAM_FLUSH_MS = int(os.getenv("CHAT_STREAM_FLUSH_MS", 30))
+CHAT_STREAM_FLUSH_BYTES = int(os.getenv("CHAT_STREAM_FLUSH_BYTES", 64))
+
+# Keeps references to fire-and-forget tasks so that they are not garbage collected
+_background_tasks = set()
+
+def message_text(message: Message) -> str:
+    return remove_citation("".join(block.text.value for block in message.content if block.type == "text"))
+
+async def _store_messages(db: AsyncSession, thread: Thread, messages: Sequence[Message]):
+    if not messages:
+        return
+
+    stmt = insert(ThreadMessage).values([
+        {
+            "thread_id": thread.thread_id,
+            "message_id": message.id,
+            "role": message.role,
+            "content": message_text(message),
+            "created_at": message.created_at,
+        }
+        for message in messages
+    ])
+    # A message stored while it was still being written is replaced when it completes
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ThreadMessage.message_id],
+        set_={"content": stmt.excluded.content}
+    )
+    await db.execute(stmt)
+    thread.last_message_id = messages[-1].id
+
+async def sync_thread_messages(db: AsyncSession, thread: Thread):
+    """
+    Fetch the messages of an OpenAI thread that are newer than the last stored one,
+    and store them. The store is marked as synced unless a run is still writing a message.
+    """
+    params = {"order": "asc"}
+    if thread.last_message_id:
+        params["after"] = thread.last_message_id
+
+    messages: List[Message] = []
+    in_progress = False
+    async for message in client.beta.threads.messages.list(thread.thread_id, **params):
+        if message.status == "in_progress":
+            in_progress = True
+            break
+        messages.append(message)
+
+    await _store_messages(db, thread, messages)
+    thread.messages_synced = not in_progress
+    await db.commit()
+
+async def load_thread_messages(db: AsyncSession, thread: Thread) -> List[ThreadMessage]:
+    """Get the messages of a thread, oldest first, syncing them from OpenAI first if needed."""
+    if not thread.messages_synced:
+        await sync_thread_messages(db, thread)
+
+    result = await db.execute(
+        select(ThreadMessage).where(ThreadMessage.thread_id == thread.thread_id).order_by(ThreadMessage.id)
+    )
+    return result.scalars().all()
+
+async def _start_exchange(thread_id: str, user_message: Message) -> bool:
+    """
+    Store the user's message, and mark the store as behind the thread until the reply
+    is stored too. Returns False, storing nothing, if the store was already behind.
+    """
+    async with AsyncSessionLocal() as db:
+        thread = await db.get(Thread, thread_id)
+        if thread is None or not thread.messages_synced:
+            return False
+        await _store_messages(db, thread, [user_message])
+        thread.messages_synced = False
+        await db.commit()
+        return True
+
+async def _finish_exchange(thread_id: str, replies: Sequence[Message]):
+    async with AsyncSessionLocal() as db:
+        thread = await db.get(Thread, thread_id)
+        if thread is None:
+            return
+        await _store_messages(db, thread, replies)
+        thread.messages_synced = True
+        await db.commit()
+
+async def stream_chat_responses(
+    thread_id: str,
+    query: str,
+    ticket: RunTicket,
+    cache_reply: bool = False
+) -> AsyncGenerator[str, None]:
+    """
+    Add the query to the thread and stream the assistant's reply as `{"token": ...}` events.
+    While waiting for a run slot, `{"queue_position": n}` events are sent instead.
+
+    Args:
+        - ticket (RunTicket): The run slot request, from `run_scheduler.enqueue`. It is
+        released when the stream ends.
+        - cache_reply (bool): Whether to add the reply to the answer cache. Only for the
+        first message of a thread, since later answers depend on the conversation.
+    """
+    try:
+        async for position in ticket.wait():
+            yield json.dumps({ "queue_position": position })
+
+        user_message = await client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=query
+        )
+        # If the stream ends early, the store stays behind and is synced on the next read
+        store_reply = await _start_exchange(thread_id, user_message)
+
+        for attempt in range(CHAT_RUN_MAX_RETRIES + 1):
+            run = _RunState()
+            chunks = _stream_run(thread_id, run)
+            try:
+                async for chunk in chunks:
+                    yield chunk
+                break
+            except (RateLimitError, RunRateLimited):
+                # Retry only if the client has not seen any of the failed run's output
+                if run.started or attempt == CHAT_RUN_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(retry_delay(attempt))
+            finally:
+                # Close the run's stream now (aborting it if unfinished), not when garbage collected
+                await chunks.aclose()
+
+        if store_reply:
+            await _finish_exchange(thread_id, run.replies)
+        if cache_reply:
+            await cache_answer(query, "".join(message_text(reply) for reply in run.replies))
+    finally:
+        ticket.release()
+
+async def replay_answer(thread_id: str, query: str, answer: str) -> AsyncGenerator[str, None]:
+    """Stream a cached answer as `{"token": ...}` events, without running the assistant."""
+    # Add the exchange to the thread while the answer is sent. The stream only ends once
+    # it is added, so that a follow-up message cannot overtake it.
+    task = asyncio.get_running_loop().create_task(_add_exchange(thread_id, query, answer))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    for start in range(0, len(answer), CHAT_STREAM_FLUSH_BYTES):
+        yield json.dumps({ "token": answer[start:start + CHAT_STREAM_FLUSH_BYTES] })
+    # Shielded so that the exchange is still added if the client disconnects
+    await asyncio.shield(task)
+
+async def _add_exchange(thread_id: str, query: str, answer: str):
+    user_message = await client.beta.threads.messages.create(
         thread_id=thread_id,
         role="user",
         content=query
     )
+    store_reply = await _start_exchange(thread_id, user_message)
+    reply = await client.beta.threads.messages.create(
+        thread_id=thread_id,
+        role="assistant",
+        content=answer
+    )
+    if store_reply:
+        await _finish_exchange(thread_id, [reply])
 
-    stream = client.beta.threads.runs.create(
+async def _stream_run(thread_id: str, run: "_RunState") -> AsyncGenerator[str, None]:
+    stream = await client.beta.threads.runs.create(
         thread_id=thread_id,
         # TODO: get from config
         assistant_id=os.getenv('OPENAI_ASSISTANT_ID'),
@@ -35,14 +206,122 @@ async def stream_chat_responses(thread_id: str, query: str) -> AsyncGenerator[st
         response_format={ "type": "json_object" }
     )
 
-    for event in stream:
+    try:
+        # Each chunk is only read from upstream after the previous one has been sent,
+        # so a slow client slows down reading rather than growing a buffer
+        async for chunk in coalesce_tokens(_run_tokens(stream, run)):
+            run.started = True
+            yield json.dumps({ "token": chunk })
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client disconnected, so stop the run instead of generating a reply nobody reads
+        _abort_run(thread_id, run.id, stream)
+        raise
+    except RunRateLimited:
+        await stream.close()
+        raise
+
+
+class RunRateLimited(Exception):
+    """Raised when a run fails because OpenAI's rate limit was exceeded."""
+
+class _RunState:
+    __slots__ = ("id", "replies", "started")
+
+    def __init__(self):
+        self.id: Optional[str] = None
+        self.replies: List[Message] = []
+        # Whether any of the run's output was sent
+        self.started = False
+
+async def _run_tokens(stream: AsyncStream, run: _RunState) -> AsyncIterator[str]:
+    citations = CitationFilter()
+    async for event in stream:
+        if isinstance(event, ThreadRunCreated):
+            run.id = event.data.id
+        elif isinstance(event, ThreadRunFailed) and event.data.last_error \
+                and event.data.last_error.code == "rate_limit_exceeded":
+            raise RunRateLimited(event.data.last_error.message)
+        elif isinstance(event, ThreadMessageCompleted):
+            run.replies.append(event.data)
+            # Citations do not span messages, as in `message_text`
+            rest = citations.flush()
+            if rest:
+                yield rest
         async for token in process_event(event):
-            yield json.dumps({ "token": token })
-            # let the event loop actually send the token before processing the next.
-            # this prevents tokens from being buffered because they're processed
-            # in the same event loop.
-            await asyncio.sleep(0)
-        
+            text = citations.feed(token)
+            if text:
+                yield text
+
+    rest = citations.flush()
+    if rest:
+        yield rest
+
+def _abort_run(thread_id: str, run_id: Optional[str], stream: AsyncStream):
+    async def abort():
+        await stream.close()
+        if run_id:
+            try:
+                await client.beta.threads.runs.cancel(run_id, thread_id=thread_id)
+            except OpenAIError:
+                # The run may have finished in the meantime
+                pass
+
+    task = asyncio.get_running_loop().create_task(abort())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def coalesce_tokens(
+    tokens: AsyncIterator[str],
+    flush_ms: int = CHAT_STREAM_FLUSH_MS,
+    flush_bytes: int = CHAT_STREAM_FLUSH_BYTES
+) -> AsyncIterator[str]:
+    """
+    Join tokens into chunks, yielding a chunk once `flush_ms` have passed since its
+    first token or once it reaches `flush_bytes`, whichever comes first.
+    """
+    if flush_ms <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    deadline = 0.0
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(tokens.__anext__())
+            timeout = max(deadline - loop.time(), 0) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                # Time window elapsed while waiting for the next token
+                yield "".join(buffer)
+                buffer, size = [], 0
+                continue
+
+            finished, pending = pending, None
+            try:
+                token = finished.result()
+            except StopAsyncIteration:
+                break
+
+            if not buffer:
+                deadline = loop.time() + flush_ms / 1000
+            buffer.append(token)
+            size += len(token.encode())
+            if size >= flush_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
 
 async def process_event(event):
     if isinstance(event, ThreadMessageDelta):
@@ -63,6 +342,62 @@ async def process_event(event):
     ):
         raise Exception("Run failed")
 
-# Temporary solution to remove citation from the openai response
+CITATION_OPEN = "【"
+CITATION_CLOSE = "】"
+# Longest citation text between the brackets; a longer bracketed span is kept as is.
+# File search citations look like 【4:0†source】, so this is generous.
+MAX_CITATION_LENGTH = 100
+
+class CitationFilter:
+    """
+    Removes file search citations from text that arrives in chunks, e.g. streamed deltas.
+
+    Equivalent to removing every match of `【[^】]{0,MAX_CITATION_LENGTH}】` from the
+    whole text, but each chunk is scanned once: text after an opening bracket is held
+    back until the citation closes (and is dropped) or grows too long to be one (and
+    is released). Call `flush` at the end of the text to release a citation left open.
+    """
+
+    def __init__(self):
+        # Text of the citation in progress, starting with the opening bracket
+        self._held: Optional[str] = None
+
+    def feed(self, chunk: str) -> str:
+        """Filter the next chunk, returning the text that can be output so far."""
+        out = []
+        i = 0
+        while i < len(chunk):
+            if self._held is None:
+                start = chunk.find(CITATION_OPEN, i)
+                if start < 0:
+                    out.append(chunk[i:])
+                    break
+                out.append(chunk[i:start])
+                self._held = CITATION_OPEN
+                i = start + 1
+                continue
+
+            end = chunk.find(CITATION_CLOSE, i)
+            length = len(self._held) - 1 + ((end if end >= 0 else len(chunk)) - i)
+            if length > MAX_CITATION_LENGTH:
+                # Too long to be a citation: output the opening bracket as text and
+                # rescan what followed it, which is shorter than the limit
+                held, self._held = self._held, None
+                out.append(CITATION_OPEN)
+                out.append(self.feed(held[1:]))
+            elif end >= 0:
+                self._held = None
+                i = end + 1
+            else:
+                self._held += chunk[i:]
+                break
+        return "".join(out)
+
+    def flush(self) -> str:
+        """Return any citation left open, since without its closing bracket it is plain text."""
+        held, self._held = self._held, None
+        return held or ""
+
 def remove_citation(text: str) -> str:
-    return re.sub(r'【.*】', '', text)
\ No newline at end of file
+    citations = CitationFilter()
+    return citations.feed(text) + citations.flush()
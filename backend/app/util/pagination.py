@@ -0,0 +1,70 @@
+# Helpers for keyset (cursor) pagination
+
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, List, MutableMapping
+
+from fastapi import HTTPException
+
+# Page sizes for list endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 500))
+
+# List endpoints return bare arrays, so the cursor of the next page is sent in a
+# header (absent on the last page). Pass it back as the `cursor` query parameter.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Encode the sort key of the last item on a page into an opaque cursor.
+    Supports JSON-serializable values and datetimes.
+    """
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, length: int) -> List[Any]:
+    """
+    Decode a cursor created by `encode_cursor` back into its sort key values.
+
+    Raises:
+        - HTTPException: 400 if the cursor is malformed or has the wrong number of values
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, list) or len(payload) != length:
+            raise ValueError("unexpected cursor length")
+        return [
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in payload
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def set_next_cursor(
+    headers: MutableMapping[str, str],
+    items: List[Any],
+    limit: int,
+    cursor_of: Callable[[Any], str]
+) -> List[Any]:
+    """
+    Trim a page fetched with `limit + 1` rows to `limit`, and set the next cursor
+    header from the last item kept if there were more rows.
+
+    Args:
+        - headers (MutableMapping[str, str]): Response headers to set the cursor in
+        - items (List[Any]): Rows fetched with a limit of `limit + 1`
+        - limit (int): Page size
+        - cursor_of (Callable[[Any], str]): Returns the cursor for an item
+
+    Returns:
+        - List[Any]: The items on this page
+    """
+    if len(items) > limit:
+        headers[NEXT_CURSOR_HEADER] = cursor_of(items[limit - 1])
+    return items[:limit]
@@ -0,0 +1,83 @@
+# Cache of serialized GET responses, served with strong ETags for conditional requests
+
+import hashlib
+import os
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from app.core.cache import Cache
+
+# Upper bound on staleness in case an invalidation is missed
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 300))
+# How long browsers and CDNs may reuse a response before revalidating it
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", 60))
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag, using weak comparison as the spec requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """
+    Cache of JSON response bodies for a group of related endpoints, in a versioned
+    namespace of the shared cache.
+
+    Writes to the underlying data call `invalidate`, which bumps the namespace
+    version so that every worker misses on its next request. Responses must be built
+    from the primary database: a lagging replica could serve pre-write data, which
+    would then be cached under the new version.
+    """
+
+    def __init__(self, namespace: str, ttl: int = RESPONSE_CACHE_TTL, max_age: int = RESPONSE_CACHE_MAX_AGE):
+        self._cache = Cache(namespace, ttl=ttl, versioned=True)
+        self.cache_control = f"public, max-age={max_age}, must-revalidate"
+
+    async def invalidate(self):
+        await self._cache.clear()
+
+    async def respond(
+        self,
+        request: Request,
+        build: Callable[[], Awaitable[Tuple[bytes, Optional[Dict[str, str]]]]]
+    ) -> Response:
+        """
+        Serve a request from the cache, building and storing the response on a miss.
+        Concurrent misses for the same request share one build.
+        Requests whose If-None-Match matches the current ETag get a 304.
+
+        Args:
+            - request (Request): The incoming request; its path and query string are the cache key
+            - build (Callable): Returns the serialized JSON body and any extra response headers
+
+        Returns:
+            - Response: 200 with the body, or 304 without one
+        """
+        # Re-encoded, so that parameters containing "&" or "=" cannot collide with others
+        key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+
+        async def compute():
+            body, headers = await build()
+            return {"body": body.decode(), "etag": make_etag(body), "headers": headers or {}}
+
+        entry = await self._cache.get_or_set(key, compute)
+
+        headers = {**entry["headers"], "ETag": entry["etag"], "Cache-Control": self.cache_control}
+        if etag_matches(request.headers.get("If-None-Match"), entry["etag"]):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+# Dementia daycare catalogue (list, details and addresses), invalidated by
+# writes to centres and their reviews
+catalogue_cache = ResponseCache("catalogue")
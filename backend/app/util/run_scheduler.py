@@ -0,0 +1,179 @@
+# Bounds how many assistant runs a worker streams at once, globally and per user
+
+import asyncio
+import bisect
+import itertools
+import os
+import random
+from typing import AsyncIterator, Dict, List, Tuple
+
+CHAT_MAX_CONCURRENT_RUNS = int(os.getenv("CHAT_MAX_CONCURRENT_RUNS", 20))
+CHAT_MAX_RUNS_PER_USER = int(os.getenv("CHAT_MAX_RUNS_PER_USER", 2))
+CHAT_RUN_QUEUE_SIZE = int(os.getenv("CHAT_RUN_QUEUE_SIZE", 100))
+
+# Retries of runs that fail on OpenAI's rate limit before producing any output
+CHAT_RUN_MAX_RETRIES = int(os.getenv("CHAT_RUN_MAX_RETRIES", 3))
+RUN_RETRY_BACKOFF_BASE = 1.0  # seconds, doubled on each retry
+RUN_RETRY_BACKOFF_MAX = 20.0
+
+
+class RunQueueFull(Exception):
+    """Raised when a run is requested while the wait queue is full."""
+
+
+def retry_delay(attempt: int) -> float:
+    delay = min(RUN_RETRY_BACKOFF_BASE * (2 ** attempt), RUN_RETRY_BACKOFF_MAX)
+    # Full jitter, so that runs that were rate limited together do not retry together
+    return random.uniform(0, delay)
+
+
+class RunTicket:
+    """A request for a run slot. Always `release` it, whether or not it was granted."""
+
+    __slots__ = ("user_id", "granted", "_scheduler", "_updated", "_released")
+
+    def __init__(self, scheduler: "RunScheduler", user_id: str):
+        self.user_id = user_id
+        self.granted = False
+        self._scheduler = scheduler
+        # Set whenever the ticket is granted or its queue position may have changed
+        self._updated = asyncio.Event()
+        self._released = False
+
+    async def wait(self) -> AsyncIterator[int]:
+        """
+        Wait for a slot, yielding the ticket's 1-based queue position whenever it changes.
+        Yields nothing if a slot was free.
+        """
+        last = None
+        while True:
+            self._updated.clear()
+            if self.granted:
+                return
+            position = self._scheduler.position(self)
+            if position != last:
+                last = position
+                yield position
+                continue
+            await self._updated.wait()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self)
+
+
+class RunScheduler:
+    """
+    Grants run slots to tickets, at most `max_concurrent` at a time and at most
+    `max_per_user` to the same user, queueing up to `queue_size` tickets.
+
+    Waiting tickets are served by start-time fair queuing: a user's next ticket is
+    tagged one round after their previous one (or with the current round, if they have
+    nothing queued or running), and tickets are granted in round order. A user sending
+    a burst of messages therefore waits behind other users' first messages, rather than
+    holding everyone else up.
+
+    Limits apply per worker process.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = CHAT_MAX_CONCURRENT_RUNS,
+        max_per_user: int = CHAT_MAX_RUNS_PER_USER,
+        queue_size: int = CHAT_RUN_QUEUE_SIZE
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self._active = 0
+        # user -> number of granted (active) and waiting tickets, without zeroes
+        self._active_by_user: Dict[str, int] = {}
+        self._waiting_by_user: Dict[str, int] = {}
+        # user -> round of their latest ticket, while they have any
+        self._last_round: Dict[str, int] = {}
+        # Round of the latest granted ticket
+        self._round = 0
+        # ((round, sequence number), ticket), sorted
+        self._waiting: List[Tuple[Tuple[int, int], RunTicket]] = []
+        self._seq = itertools.count()
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._waiting) >= self.queue_size
+
+    def enqueue(self, user_id: str) -> RunTicket:
+        """
+        Request a run slot for a user. The ticket is granted immediately if a slot is free.
+
+        Raises:
+            - RunQueueFull: If no slot is free and the queue is full
+        """
+        ticket = RunTicket(self, user_id)
+        last_round = self._last_round.get(user_id)
+        start_round = self._round if last_round is None else max(self._round, last_round + 1)
+        if not self._waiting and self._can_grant(user_id):
+            self._grant(ticket, start_round)
+            return ticket
+        if self.is_full:
+            raise RunQueueFull()
+
+        self._last_round[user_id] = start_round
+        self._waiting_by_user[user_id] = self._waiting_by_user.get(user_id, 0) + 1
+        bisect.insort(self._waiting, ((start_round, next(self._seq)), ticket))
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: RunTicket) -> int:
+        for index, (_, waiting) in enumerate(self._waiting):
+            if waiting is ticket:
+                return index + 1
+        return 0
+
+    def _can_grant(self, user_id: str) -> bool:
+        return self._active < self.max_concurrent and self._active_by_user.get(user_id, 0) < self.max_per_user
+
+    def _grant(self, ticket: RunTicket, start_round: int):
+        self._active += 1
+        self._active_by_user[ticket.user_id] = self._active_by_user.get(ticket.user_id, 0) + 1
+        self._last_round[ticket.user_id] = max(self._last_round.get(ticket.user_id, start_round), start_round)
+        self._round = max(self._round, start_round)
+        ticket.granted = True
+        ticket._updated.set()
+
+    def _dispatch(self):
+        index = 0
+        while index < len(self._waiting) and self._active < self.max_concurrent:
+            (start_round, _), ticket = self._waiting[index]
+            if not self._can_grant(ticket.user_id):
+                index += 1
+                continue
+            del self._waiting[index]
+            self._decrement(self._waiting_by_user, ticket.user_id)
+            self._grant(ticket, start_round)
+
+        # Positions may have changed for every ticket still waiting
+        for _, ticket in self._waiting:
+            ticket._updated.set()
+
+    def _release(self, ticket: RunTicket):
+        if ticket.granted:
+            self._active -= 1
+            self._decrement(self._active_by_user, ticket.user_id)
+        else:
+            self._waiting = [entry for entry in self._waiting if entry[1] is not ticket]
+            self._decrement(self._waiting_by_user, ticket.user_id)
+
+        user_id = ticket.user_id
+        if user_id not in self._active_by_user and user_id not in self._waiting_by_user:
+            del self._last_round[user_id]
+        self._dispatch()
+
+    @staticmethod
+    def _decrement(counts: Dict[str, int], user_id: str):
+        counts[user_id] -= 1
+        if not counts[user_id]:
+            del counts[user_id]
+
+
+run_scheduler = RunScheduler()
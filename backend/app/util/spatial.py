@@ -0,0 +1,248 @@
+# In-memory spatial index for nearest-neighbour lookups on care service locations
+
+import math
+import threading
+from heapq import heappush, heappushpop
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Points per leaf; below this a linear scan is cheaper than descending further
+LEAF_SIZE = 8
+
+Point = Tuple[float, float, float]
+
+
+def to_unit_vector(lat: float, lng: float) -> Point:
+    """
+    Project a lat/lng pair onto the unit sphere.
+
+    Euclidean (chord) distance between unit vectors increases monotonically with
+    great-circle distance, so a KD-tree over these points returns exact nearest neighbours.
+    """
+    phi = math.radians(lat)
+    theta = math.radians(lng)
+    return (
+        math.cos(phi) * math.cos(theta),
+        math.cos(phi) * math.sin(theta),
+        math.sin(phi),
+    )
+
+
+def chord_to_km(chord_sq: float) -> float:
+    """Convert a squared chord length on the unit sphere to a great-circle distance in km."""
+    chord = math.sqrt(chord_sq)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class _Node:
+    __slots__ = ("axis", "split", "left", "right", "items")
+
+    def __init__(self, axis=None, split=None, left=None, right=None, items=None):
+        self.axis = axis
+        self.split = split
+        self.left = left
+        self.right = right
+        self.items = items
+
+
+def _build(items: List[Tuple[Point, int]], depth: int = 0) -> Optional[_Node]:
+    if not items:
+        return None
+    if len(items) <= LEAF_SIZE:
+        return _Node(items=items)
+
+    axis = depth % 3
+    items.sort(key=lambda item: item[0][axis])
+    mid = len(items) // 2
+    return _Node(
+        axis=axis,
+        split=items[mid][0][axis],
+        left=_build(items[:mid], depth + 1),
+        right=_build(items[mid:], depth + 1),
+    )
+
+
+class KDTree:
+    """Static 3-d tree over unit vectors, keyed by an integer id."""
+
+    def __init__(self, points: Iterable[Tuple[int, float, float]]):
+        self._root = _build([(to_unit_vector(lat, lng), id) for id, lat, lng in points])
+
+    def nearest(self, lat: float, lng: float, k: int) -> List[Tuple[int, float]]:
+        """
+        Find the k nearest points to the given location.
+
+        Returns:
+            - List[Tuple[int, float]]: (id, great-circle distance in km) pairs, closest first
+        """
+        if k <= 0 or self._root is None:
+            return []
+
+        target = to_unit_vector(lat, lng)
+        # Max-heap of (-squared distance, id) holding the best k so far
+        best: List[Tuple[float, int]] = []
+
+        def visit(node: _Node):
+            if node.items is not None:
+                for point, id in node.items:
+                    dist_sq = (
+                        (point[0] - target[0]) ** 2
+                        + (point[1] - target[1]) ** 2
+                        + (point[2] - target[2]) ** 2
+                    )
+                    if len(best) < k:
+                        heappush(best, (-dist_sq, id))
+                    elif dist_sq < -best[0][0]:
+                        heappushpop(best, (-dist_sq, id))
+                return
+
+            diff = target[node.axis] - node.split
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            if near is not None:
+                visit(near)
+            # Only cross the splitting plane if it is closer than the current kth best
+            if far is not None and (len(best) < k or diff * diff < -best[0][0]):
+                visit(far)
+
+        visit(self._root)
+        return [(id, chord_to_km(-neg_dist_sq)) for neg_dist_sq, id in sorted(best, reverse=True)]
+
+
+class HaversineScorer:
+    """
+    Vectorized great-circle scorer over a fixed set of points.
+
+    Point coordinates are held in contiguous float arrays so that distances from
+    many origins to every point are computed in a single NumPy pass.
+    """
+
+    def __init__(self, points: Iterable[Tuple[int, float, float]]):
+        ids, lats, lngs = [], [], []
+        for id, lat, lng in points:
+            ids.append(id)
+            lats.append(lat)
+            lngs.append(lng)
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self._lat = np.ascontiguousarray(np.radians(np.asarray(lats, dtype=np.float64)))
+        self._lng = np.ascontiguousarray(np.radians(np.asarray(lngs, dtype=np.float64)))
+        self._cos_lat = np.cos(self._lat)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def distances(self, origins: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """
+        Compute the distance matrix from each origin to every point.
+
+        Args:
+            - origins (Sequence[Tuple[float, float]]): (lat, lng) pairs
+
+        Returns:
+            - np.ndarray: (len(origins), len(points)) matrix of great-circle distances in km,
+            with columns in the same order as `ids`
+        """
+        origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+        origin_lat = origins[:, 0:1]
+        origin_lng = origins[:, 1:2]
+
+        a = (
+            np.sin((self._lat - origin_lat) / 2) ** 2
+            + np.cos(origin_lat) * self._cos_lat * np.sin((self._lng - origin_lng) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def nearest(self, origins: Sequence[Tuple[float, float]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest points to each origin.
+
+        Returns:
+            - Tuple[np.ndarray, np.ndarray]: (ids, distances) matrices of shape
+            (len(origins), min(k, len(points))), closest first in each row
+        """
+        distances = self.distances(origins)
+        k = min(k, distances.shape[1])
+        if k <= 0:
+            empty = np.empty((distances.shape[0], 0))
+            return empty.astype(np.int64), empty
+
+        # Partition to the k smallest per row, then sort only those k
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < distances.shape[1] \
+            else np.tile(np.arange(k), (distances.shape[0], 1))
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return self.ids[top], np.take_along_axis(top_distances, order, axis=1)
+
+
+class SpatialIndex:
+    """
+    Lazily built nearest-neighbour index over (id, lat, lng) points.
+
+    Single-origin queries go through a KD-tree; batches of origins go through a
+    vectorized scorer, each built on first use. Callers `load` the points when
+    `is_loaded` is False (on first use, or after `invalidate`), optionally tagged
+    with a `version` to compare against the source's current version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self._points: Optional[Dict[int, Tuple[float, float]]] = None
+        self._tree: Optional[KDTree] = None
+        self._scorer: Optional[HaversineScorer] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._points is not None
+
+    def load(self, points: Iterable[Tuple[int, float, float]], version=None):
+        """Replace all points in the index."""
+        with self._lock:
+            self.version = version
+            self._points = {id: (lat, lng) for id, lat, lng in points}
+            self._tree = None
+            self._scorer = None
+
+    def _get_points(self) -> Dict[int, Tuple[float, float]]:
+        if self._points is None:
+            raise RuntimeError("Spatial index has not been loaded")
+        return self._points
+
+    def _get_tree(self) -> KDTree:
+        with self._lock:
+            points = self._get_points()
+            if self._tree is None:
+                self._tree = KDTree((id, lat, lng) for id, (lat, lng) in points.items())
+            return self._tree
+
+    def _get_scorer(self) -> HaversineScorer:
+        with self._lock:
+            points = self._get_points()
+            if self._scorer is None:
+                self._scorer = HaversineScorer((id, lat, lng) for id, (lat, lng) in points.items())
+            return self._scorer
+
+    def nearest(self, lat: float, lng: float, k: int) -> List[Tuple[int, float]]:
+        """
+        Get the ids of the k points nearest to the given location, closest first.
+        """
+        return self._get_tree().nearest(lat, lng, k)
+
+    def nearest_batch(self, origins: Sequence[Tuple[float, float]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the k nearest points to each of many origins in one vectorized pass.
+        See `HaversineScorer.nearest` for the return value.
+        """
+        return self._get_scorer().nearest(origins, k)
+
+    def invalidate(self):
+        """Drop all points so that they are reloaded before the next query."""
+        with self._lock:
+            self.version = None
+            self._points = None
+            self._tree = None
+            self._scorer = None
@@ -0,0 +1,158 @@
+import asyncio
+
+import fakeredis.aioredis
+import pytest
+import pytest_asyncio
+
+from app.core import cache as cache_module
+from app.core.cache import Cache, CacheBackend, RedisBackend, set_cache_backend
+
+
+@pytest_asyncio.fixture
+async def redis():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    set_cache_backend(RedisBackend(client))
+    yield client
+    set_cache_backend(None)
+    await client.aclose()
+
+
+class FailingBackend(CacheBackend):
+    async def get_many(self, keys):
+        raise ConnectionError("cache server down")
+
+    async def set_many(self, items, ttl=None):
+        raise ConnectionError("cache server down")
+
+    async def add(self, key, value, ttl=None):
+        raise ConnectionError("cache server down")
+
+    async def incr(self, key):
+        raise ConnectionError("cache server down")
+
+    async def delete(self, *keys):
+        raise ConnectionError("cache server down")
+
+
+@pytest.mark.asyncio
+async def test_keys_are_namespaced(redis):
+    await Cache("a").set("key", {"value": 1})
+    await Cache("b").set("key", {"value": 2})
+
+    assert await Cache("a").get("key") == {"value": 1}
+    assert await Cache("b").get("key") == {"value": 2}
+    assert await redis.get(f"{cache_module.CACHE_KEY_PREFIX}:a:key") == '{"value":1}'
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl(redis):
+    cache = Cache("ttl", ttl=0.05)
+    await cache.set("default", 1)
+    await cache.set("longer", 2, ttl=60)
+
+    await asyncio.sleep(0.1)
+    assert await cache.get_many(["default", "longer"]) == [None, 2]
+
+
+@pytest.mark.asyncio
+async def test_clear_drops_every_key_of_a_versioned_namespace(redis):
+    cache = Cache("versioned", versioned=True)
+    other = Cache("other")
+    await cache.set_many({"a": 1, "b": 2})
+    await other.set("a", 3)
+
+    await cache.clear()
+    assert await cache.get_many(["a", "b"]) == [None, None]
+    assert await other.get("a") == 3
+
+    await cache.set("a", 4)
+    assert await cache.get("a") == 4
+
+
+@pytest.mark.asyncio
+async def test_clear_requires_a_versioned_namespace(redis):
+    with pytest.raises(RuntimeError):
+        await Cache("unversioned").clear()
+
+
+@pytest.mark.asyncio
+async def test_get_or_set_computes_once_under_concurrency(redis):
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"value": calls}
+
+    cache = Cache("single-flight")
+    results = await asyncio.gather(*(cache.get_or_set("key", compute) for _ in range(10)))
+
+    assert calls == 1
+    assert results == [{"value": 1}] * 10
+    assert await cache.get("key") == {"value": 1}
+
+
+@pytest.mark.asyncio
+async def test_get_or_set_waits_for_another_process(redis, monkeypatch):
+    monkeypatch.setattr(cache_module, "SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        return "computed here"
+
+    # Separate instances do not share in-flight futures, like separate workers
+    holder, waiter = Cache("cross-process"), Cache("cross-process")
+    await redis.set(f"{cache_module.CACHE_KEY_PREFIX}:cross-process:__lock__:key", "1")
+
+    async def finish_elsewhere():
+        await asyncio.sleep(0.05)
+        await holder.set("key", "computed elsewhere")
+
+    result, _ = await asyncio.gather(waiter.get_or_set("key", compute), finish_elsewhere())
+    assert result == "computed elsewhere"
+    assert calls == 0
+
+
+@pytest.mark.asyncio
+async def test_get_or_set_stops_waiting_when_another_process_fails(redis, monkeypatch):
+    monkeypatch.setattr(cache_module, "SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+    lock_key = f"{cache_module.CACHE_KEY_PREFIX}:failed-elsewhere:__lock__:key"
+    await redis.set(lock_key, "1")
+
+    async def fail_elsewhere():
+        # The lock is released without a value, as when computing it raised
+        await asyncio.sleep(0.05)
+        await redis.delete(lock_key)
+
+    async def compute():
+        return "computed here"
+
+    started = asyncio.get_running_loop().time()
+    result, _ = await asyncio.gather(Cache("failed-elsewhere").get_or_set("key", compute), fail_elsewhere())
+    assert result == "computed here"
+    assert asyncio.get_running_loop().time() - started < cache_module.SINGLE_FLIGHT_TIMEOUT / 2
+
+
+@pytest.mark.asyncio
+async def test_get_or_set_does_not_cache_none(redis):
+    async def compute():
+        return None
+
+    cache = Cache("none")
+    assert await cache.get_or_set("key", compute) is None
+    assert await redis.keys(f"{cache_module.CACHE_KEY_PREFIX}:none:*") == []
+
+
+@pytest.mark.asyncio
+async def test_backend_errors_are_misses():
+    cache = Cache("failing", versioned=True, backend=FailingBackend())
+
+    async def compute():
+        return 1
+
+    assert await cache.get("key") is None
+    await cache.set("key", 1)
+    assert await cache.get_or_set("key", compute) == 1
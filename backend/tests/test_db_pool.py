@@ -0,0 +1,32 @@
+from sqlalchemy import create_engine
+
+from app.core.database import MeteredQueuePool
+
+
+def make_engine(pool_size=1, max_overflow=2):
+    return create_engine("sqlite://", poolclass=MeteredQueuePool, pool_size=pool_size, max_overflow=max_overflow)
+
+
+def test_counts_only_checkouts_that_open_overflow_connections():
+    engine = make_engine()
+    pooled = engine.connect()
+    overflow = engine.connect()
+    pooled.close()
+
+    # Reuses the pooled connection while the overflow one is still open
+    reused = engine.connect()
+    stats = engine.pool.stats()
+    assert stats["checkouts"] == 3
+    assert stats["overflow_checkouts"] == 1
+
+    reused.close()
+    overflow.close()
+    engine.dispose()
+
+
+def test_metrics_survive_dispose():
+    engine = make_engine()
+    engine.connect().close()
+    engine.dispose()
+    engine.connect().close()
+    assert engine.pool.stats()["checkouts"] == 2
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import fakeredis.aioredis
+import pytest
+import pytest_asyncio
+
+from app.core.cache import RedisBackend, set_cache_backend
+from app.util import maps
+
+
+@pytest_asyncio.fixture
+async def redis():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    set_cache_backend(RedisBackend(client))
+    maps._local_geocode_cache.clear()
+    yield client
+    maps._local_geocode_cache.clear()
+    set_cache_backend(None)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_repeat_geocode_lookups_stay_in_process(redis):
+    await maps._set_cached_coord("123456", (1.3, 103.8), datetime.now())
+    await redis.flushall()
+
+    assert await maps.getCoordFromAddress("1 Example Road, Singapore 123456") == (1.3, 103.8)
+
+
+@pytest.mark.asyncio
+async def test_shared_geocode_hits_are_kept_in_process_until_they_expire(redis):
+    fetched_at = datetime.now()
+    await maps._set_cached_coord("123456", None, fetched_at)
+    maps._local_geocode_cache.clear()
+
+    assert await maps._get_cached_coord("123456") == (True, None)
+    _, expires_at = maps._local_geocode_cache["123456"]
+    assert expires_at == maps._cache_expiry(fetched_at, None)
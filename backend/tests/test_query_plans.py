@@ -0,0 +1,74 @@
+# Checks that the hot review and bookmark lookups are served by their indexes.
+# Needs a Postgres database, configured with the DB_* variables as for the app.
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+from app.core.database import build_dsn
+from app.models.bookmark import Bookmark
+from app.models.review import Review, ReviewableType
+
+
+@pytest.fixture(scope="module")
+def conn():
+    engine = create_engine(build_dsn(), poolclass=NullPool)
+    try:
+        connection = engine.connect()
+    except OperationalError as e:
+        pytest.skip(f"No database to run EXPLAIN against: {e}")
+
+    # Build the tables in a scratch schema inside a transaction that is rolled back,
+    # so the test leaves nothing behind
+    transaction = connection.begin()
+    connection.execute(text("CREATE SCHEMA query_plan_test"))
+    connection.execute(text("SET LOCAL search_path TO query_plan_test"))
+    Review.metadata.create_all(connection, tables=[Review.__table__, Bookmark.__table__])
+    # Empty tables are cheapest to scan; make the planner use an index wherever it can
+    connection.execute(text("SET LOCAL enable_seqscan = off"))
+    yield connection
+    transaction.rollback()
+    connection.close()
+    engine.dispose()
+
+
+def explain(conn, query) -> str:
+    sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    return "\n".join(row[0] for row in conn.execute(text(f"EXPLAIN {sql}")))
+
+
+@pytest.mark.parametrize("query, index", [
+    (
+        # Review pages of a target, as in `load_review_page`
+        select(Review).where(
+            Review.target_type == ReviewableType.DEMENTIA_DAY_CARE,
+            Review.target_id == 1
+        ).order_by(Review.published_time.desc(), Review.id.desc()).limit(11),
+        "ix_reviews_target_type_target_id_published_time",
+    ),
+    (
+        # Scraper upserts, as in `upsert_review`
+        select(Review).where(Review.google_review_id == "ChdDSUhNMG9nS0VJQ0FnSUQ"),
+        "ix_reviews_google_review_id",
+    ),
+    (
+        # A user's bookmarks of a target, as in `list_bookmarks`
+        select(Bookmark).where(
+            Bookmark.user_id == "user_1",
+            Bookmark.target_type == ReviewableType.DEMENTIA_DAY_CARE,
+            Bookmark.target_id == 1
+        ).order_by(Bookmark.id).limit(101),
+        "ix_bookmarks_user_id_target_type_target_id",
+    ),
+    (
+        # All of a user's bookmarks
+        select(Bookmark).where(Bookmark.user_id == "user_1").order_by(Bookmark.id).limit(101),
+        "ix_bookmarks_user_id_target_type_target_id",
+    ),
+])
+def test_lookup_uses_index(conn, query, index):
+    plan = explain(conn, query)
+    assert "Seq Scan" not in plan, plan
+    assert index in plan, plan
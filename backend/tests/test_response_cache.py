@@ -0,0 +1,39 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.core.cache import InMemoryBackend, set_cache_backend
+from app.util.response_cache import ResponseCache
+
+
+@pytest.fixture
+def client():
+    set_cache_backend(InMemoryBackend())
+    cache = ResponseCache("response-cache-test")
+    app = FastAPI()
+
+    builds = []
+
+    @app.get("/items")
+    async def items(request: Request):
+        async def build():
+            builds.append(request.query_params.multi_items())
+            return f"{len(builds)}: {builds[-1]}".encode(), None
+        return await cache.respond(request, build)
+
+    yield TestClient(app)
+    set_cache_backend(None)
+
+
+def test_query_parameters_with_separators_are_cached_separately(client):
+    encoded = client.get("/items?a=%26limit%3D1")
+    split = client.get("/items?a=&limit=1")
+
+    assert encoded.text != split.text
+    assert encoded.headers["ETag"] != split.headers["ETag"]
+
+
+def test_parameter_order_shares_an_entry(client):
+    first = client.get("/items?b=2&a=1")
+    second = client.get("/items?a=1&b=2")
+    assert first.text == second.text
@@ -0,0 +1,85 @@
+# Writes reviews through the routes with the app's async driver.
+# Needs a Postgres database, configured with the DB_* variables as for the app.
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.api.routes.reviews import GoogleReviewCreate, load_review_page, upsert_review
+from app.core.database import build_dsn
+from app.models.review import Review, ReviewAggregate, ReviewableType
+from app.util.pagination import encode_cursor
+
+SCHEMA = "review_route_test"
+
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine(
+        build_dsn(use_async=True),
+        poolclass=NullPool,
+        connect_args={"server_settings": {"search_path": SCHEMA}}
+    )
+    try:
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await connection.run_sync(
+                Review.metadata.create_all, tables=[Review.__table__, ReviewAggregate.__table__]
+            )
+    except (OSError, ConnectionError) as e:
+        await engine.dispose()
+        pytest.skip(f"No database to write reviews to: {e}")
+
+    # The routes commit, so the scratch schema is dropped afterwards instead of rolled back
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    async with engine.begin() as connection:
+        await connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    await engine.dispose()
+
+
+def google_review(published_time: str, rating: int = 5) -> GoogleReviewCreate:
+    # As sent by the Google Maps scraper
+    return GoogleReviewCreate.model_validate({
+        "review_source": "GOOGLE",
+        "target_id": 1,
+        "target_type": ReviewableType.DEMENTIA_DAY_CARE.value,
+        "overall_rating": rating,
+        "google_review_id": "review-1",
+        "author_name": "Author",
+        "google_author_url": "https://example.com/author",
+        "google_author_photo_url": "https://example.com/photo",
+        "published_time": published_time,
+    })
+
+
+def test_published_time_is_stored_as_naive_utc():
+    review = google_review("2025-03-01T10:00:00+08:00")
+    assert review.published_time == datetime(2025, 3, 1, 2, 0)
+
+
+@pytest.mark.asyncio
+async def test_upserts_scraped_review_with_utc_publish_time(db):
+    created = await upsert_review("review-1", google_review("2025-03-01T02:00:00Z"), db)
+    assert created.published_time == datetime(2025, 3, 1, 2, 0)
+
+    updated = await upsert_review("review-1", google_review("2025-03-02T02:00:00.123456Z", rating=3), db)
+    assert updated.id == created.id
+    assert updated.published_time == datetime(2025, 3, 2, 2, 0, 0, 123456)
+
+    aggregate = (await db.execute(select(ReviewAggregate))).scalars().one()
+    assert (aggregate.review_count, aggregate.rating_sum) == (1, 3)
+
+
+@pytest.mark.asyncio
+async def test_review_cursor_with_time_zone(db):
+    await upsert_review("review-1", google_review("2025-03-01T02:00:00Z"), db)
+
+    after = datetime(2025, 3, 1, 11, 0, tzinfo=timezone(timedelta(hours=8)))
+    page = await load_review_page(db, ReviewableType.DEMENTIA_DAY_CARE, 1, cursor=encode_cursor(after, 0))
+    assert [review.google_review_id for review in page.reviews] == ["review-1"]
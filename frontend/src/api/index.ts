@@ -1,5 +1,5 @@
 import { GetReviewsParams } from "@/types/api";
-import { Review } from "@/types/review";
+import { Review, ReviewPage } from "@/types/review";
 
 const baseUrl = process.env.NEXT_PUBLIC_APP_BACKEND_URL;
 let getToken: (() => Promise<string | null>) | null = null;
@@ -12,6 +12,11 @@ export const HTTP_OK = 200;
 export const HTTP_CREATED = 201;
 export const HTTP_BAD_REQUEST = 400;
 
+/** Header carrying the cursor of a list endpoint's next page. */
+const NEXT_CURSOR_HEADER = "X-Next-Cursor";
+/** Page size used to fetch whole lists (the backend's default MAX_PAGE_SIZE). */
+const LIST_PAGE_SIZE = 500;
+
 /** Response shape for successful api.get/post/patch/put/delete (throws on non-2xx). */
 export type ApiResponse<T = unknown> = {
   data: T | undefined;
@@ -93,6 +98,27 @@ export const api = {
     const res = await fetchApi(path + search);
     return toApiResponse<T>(res);
   },
+  /** Get every item of a paginated list endpoint, following its next-page cursors. */
+  async getAll<T = unknown>(
+    path: string,
+    params?: Record<string, string>,
+  ): Promise<T[]> {
+    const items: T[] = [];
+    let cursor: string | null = null;
+    do {
+      const pageParams: Record<string, string> = {
+        ...params,
+        limit: LIST_PAGE_SIZE.toString(),
+      };
+      if (cursor) pageParams.cursor = cursor;
+      const search = new URLSearchParams(pageParams);
+      const res = await fetchApi(`${path}?${search}`);
+      const { data } = await toApiResponse<T[]>(res);
+      items.push(...(data ?? []));
+      cursor = res.headers.get(NEXT_CURSOR_HEADER);
+    } while (cursor);
+    return items;
+  },
   async post<T = unknown>(
     path: string,
     body?: unknown,
@@ -132,15 +158,12 @@ export const api = {
 export const getReviews = async ({
   targetType,
   targetId,
-  skip = 0,
   limit = 100,
   reviewSource,
 }: GetReviewsParams): Promise<Review[]> => {
-  if (skip < 0) throw new Error("skip must be a non-negative number");
   if (limit <= 0) throw new Error("limit must be a positive number");
 
   const params: Record<string, string> = {
-    skip: skip.toString(),
     limit: limit.toString(),
     target_id: targetId.toString(),
   };
@@ -150,3 +173,14 @@ export const getReviews = async ({
   const res = await api.get<Review[]>("/reviews", params);
   return res.data ?? [];
 };
+
+export const getDDCReviews = async (
+  centreId: number,
+  cursor: string,
+): Promise<ReviewPage> => {
+  const res = await api.get<ReviewPage>(
+    `/services/dementia-daycare/${centreId}/reviews`,
+    { cursor },
+  );
+  return res.data ?? { reviews: [], nextCursor: null };
+};
@@ -22,7 +22,7 @@ import LoadingSpinner from "@/ui/loading";
 import CustomMarkdown from "@/ui/CustomMarkdown";
 import { SignInButton } from "@clerk/nextjs";
 import { useAuthStore } from "@/stores/auth";
-import { api } from "@/api";
+import { api, getDDCReviews } from "@/api";
 import { Rating } from "@smastrom/react-rating";
 import {
   Review,
@@ -314,7 +314,7 @@ export default function DaycareCentreDetails({
         />
       </div>
       <FinancialSupportSection />
-      <ReviewSection centreId={params.centreId} reviews={centre.reviews} />
+      <ReviewSection centreId={params.centreId} centre={centre} />
     </section>
   );
 }
@@ -468,23 +468,39 @@ function ReviewDetailDrawer({ review }: { review: Review }) {
 
 function ReviewSection({
   centreId,
-  reviews,
+  centre,
 }: {
   centreId: number;
-  reviews: Review[];
+  centre: DDCDetail;
 }) {
   const isSignedIn = useAuthStore((state) => state.isSignedIn);
+  // Reviews come newest first, one page at a time
+  const [reviews, setReviews] = useState<Review[]>(centre.reviews);
+  const [nextCursor, setNextCursor] = useState(centre.nextReviewsCursor);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
-  const sortedReviews = reviews.sort((a, b) => {
-    return (
-      new Date(b.publishedTime).getTime() - new Date(a.publishedTime).getTime()
-    );
-  });
+  useEffect(() => {
+    setReviews(centre.reviews);
+    setNextCursor(centre.nextReviewsCursor);
+  }, [centre]);
+
+  const loadMoreReviews = () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    getDDCReviews(centreId, nextCursor)
+      .then((page) => {
+        setReviews((prev) => [...prev, ...page.reviews]);
+        setNextCursor(page.nextCursor);
+      })
+      .catch((error) => {
+        console.error(error);
+        toast.error("Failed to load more reviews");
+      })
+      .finally(() => setIsLoadingMore(false));
+  };
 
-  const reviewCount = reviews.length;
-  const averageRating =
-    reviews.reduce((acc, review) => acc + review.overallRating, 0) /
-    reviewCount;
+  // The summary covers every review, not just the ones loaded so far
+  const { reviewCount, averageRating, ratingHistogram } = centre;
 
   return (
     <section className="flex flex-col gap-4">
@@ -497,8 +513,35 @@ function ReviewSection({
       {reviewCount > 0 && (
         <div className="flex place-items-center gap-4">
           <h3 className="text-5xl font-bold">{averageRating.toFixed(1)}</h3>
-          <Rating readOnly value={averageRating} className="max-w-36" />
-          {/* <span>(from {reviewCount} reviews)</span> */}
+          <div className="flex flex-col">
+            <Rating readOnly value={averageRating} className="max-w-36" />
+            <span className="text-sm text-gray-500">
+              (from {reviewCount} reviews)
+            </span>
+          </div>
+        </div>
+      )}
+      {reviewCount > 0 && (
+        <div className="flex flex-col gap-1">
+          {[5, 4, 3, 2, 1].map((rating) => (
+            <div
+              key={rating}
+              className="flex place-items-center gap-2 text-sm"
+            >
+              <span className="w-3">{rating}</span>
+              <div className="h-2 flex-1 rounded-full bg-gray-200">
+                <div
+                  className="h-2 rounded-full bg-brand-primary-500"
+                  style={{
+                    width: `${((ratingHistogram[rating - 1] ?? 0) / reviewCount) * 100}%`,
+                  }}
+                />
+              </div>
+              <span className="w-8 text-right text-gray-500">
+                {ratingHistogram[rating - 1] ?? 0}
+              </span>
+            </div>
+          ))}
         </div>
       )}
       {isSignedIn ? (
@@ -511,7 +554,7 @@ function ReviewSection({
         </SignInButton>
       )}
       <div className="flex flex-col divide-y divide-solid">
-        {sortedReviews.map((review, index) => (
+        {reviews.map((review, index) => (
           <div key={index} className="flex flex-col gap-2 py-4">
             <span className="font-semibold">{review.authorName}</span>
             <div className="flex gap-2">
@@ -533,6 +576,15 @@ function ReviewSection({
           </div>
         ))}
       </div>
+      {nextCursor && (
+        <Button
+          variant="outline"
+          isLoading={isLoadingMore}
+          onClick={loadMoreReviews}
+        >
+          Show more reviews
+        </Button>
+      )}
     </section>
   );
 }
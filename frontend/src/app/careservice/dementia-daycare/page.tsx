@@ -26,8 +26,8 @@ export default function DementiaDaycarePage() {
   useEffect(() => {
     setIsLoading(true);
     api
-      .get<DDCBase[]>("/services/dementia-daycare")
-      .then((response) => setCentres(response.data ?? []))
+      .getAll<DDCBase>("/services/dementia-daycare")
+      .then(setCentres)
       .catch((error) => {
         console.error(error);
       })
@@ -26,8 +26,8 @@ export default function SavedSearchesPage() {
 
   useEffect(() => {
     api
-      .get<Bookmark[]>("/bookmarks")
-      .then((res) => setBookmarks(res.data ?? []))
+      .getAll<Bookmark>("/bookmarks")
+      .then(setBookmarks)
       .finally(() => setIsLoading(false));
   }, []);
 
@@ -4,6 +4,5 @@ export interface GetReviewsParams {
   targetType: ReviewTargetType;
   targetId: number;
   limit: number;
-  skip?: number;
   reviewSource?: ReviewSource;
 }
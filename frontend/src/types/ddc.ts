@@ -30,7 +30,12 @@ export interface DDCDetail extends DDCBase {
   photos: string[];
   reviewCount: number;
   averageRating: number;
+  // Review counts for ratings 1 to 5
+  ratingHistogram: number[];
+  // First page of reviews, newest first
   reviews: Review[];
+  // Cursor of the next page of reviews, or null if there are no more
+  nextReviewsCursor: Nullable<string>;
 }
 
 export interface DDCRecommendation extends DDCDetail {
@@ -1,3 +1,5 @@
+import { Nullable } from "./util";
+
 export enum ReviewSource {
   GOOGLE = "GOOGLE",
   IN_APP = "IN_APP",
@@ -22,6 +24,12 @@ export type Review = {
   publishedTime: string;
 };
 
+export type ReviewPage = {
+  reviews: Review[];
+  // Cursor of the next page, or null if this is the last page
+  nextCursor: Nullable<string>;
+};
+
 export type ReviewCreate = {
   review_source: ReviewSource;
   target_id: number;